@@ -0,0 +1,18 @@
+"""Benchmarklar uchun umumiy sozlash: soxta token va vaqtinchalik DB."""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def load_bot(db_path=None):
+    os.environ.setdefault("BOT_TOKEN", "123456:BENCH-TOKEN")
+    if db_path is None:
+        db_path = Path(tempfile.mkdtemp(prefix="ustaxizmati-bench-")) / "bench.db"
+    os.environ["DB_PATH"] = str(db_path)
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    import bot
+    return bot
@@ -0,0 +1,77 @@
+"""Bir buyurtmani ko'p usta bir vaqtda "Qabul qildim" qilganda accept kechikishi.
+
+    python bench/bench_accept.py [--masters 10 50 200] [--orders 20] [--api-latency-ms 0]
+
+Har bir buyurtma barcha ustalarga "yuborilgan" (order_deliveries, message_id
+bilan). Keyin hamma ustalar bir paytda tugmani bosadi: bittasi yutadi, qolganlar
+"allaqachon qabul qilingan" oladi, yutgandan keyin boshqalarning xabari
+tahrirlanadi. accept_callback uchun p50/p95/p99 va API chaqiruvlari chiqariladi.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from _env import load_bot
+from fakebot import FakeSession, UpdateFactory, install
+from loadtest import HandlerTimer, percentile
+
+
+async def run(args):
+    os.environ.setdefault("SEND_RATE", "1000000")
+    os.environ.setdefault("SEND_CHAT_INTERVAL", "0")
+    for cls in ("READ", "WRITE", "ADMIN", "DEFAULT"):
+        os.environ.setdefault(f"THROTTLE_{cls}", "1000000/1000000")
+    bot_module = load_bot()
+    dp, bot = bot_module.dp, bot_module.bot
+    session = install(bot, FakeSession(latency=args.api_latency_ms / 1000))
+    timer = HandlerTimer()
+    dp.callback_query.middleware(timer)
+    await bot_module.init_db()
+    factory = UpdateFactory()
+
+    print(f"{'ustalar':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'yutgan':>7} {'tahrir':>7}")
+    next_user = 1_000_000
+    for masters in args.masters:
+        usta_ids = list(range(next_user, next_user + masters))
+        next_user += masters
+        for uid in usta_ids:
+            bot_module.upsert_usta_sync(uid, f"Usta {uid}", "+998901234567", "Elektrik", "Asaka")
+        orders = []
+        for _ in range(args.orders):
+            order_id = bot_module.insert_buyurtma_sync(1, "Elektrik", "Asaka", "+998911112233", "", usta_ids)
+            rows = bot_module.db_connect().execute(
+                "SELECT id, usta_id FROM order_deliveries WHERE order_id=?;", (order_id,)).fetchall()
+            bot_module.write_sync(bot_module.finish_deliveries_tx,
+                                  [("sent", r["id"], None, 0, r["id"]) for r in rows])
+            orders.append(order_id)
+
+        timer.samples.clear()
+        session.counts.clear()
+        for order_id in orders:
+            await asyncio.gather(*(dp.feed_update(bot, factory.callback(uid, f"accept:{order_id}"))
+                                   for uid in usta_ids))
+        values = timer.samples["accept_callback"]
+        winners = bot_module.db_connect().execute(
+            f"SELECT count(*) FROM buyurtmalar WHERE status='accepted' AND id IN ({','.join('?' * len(orders))});",
+            orders).fetchone()[0]
+        print(f"{masters:>8} {percentile(values, .5) * 1e3:9.2f} {percentile(values, .95) * 1e3:9.2f} "
+              f"{percentile(values, .99) * 1e3:9.2f} {winners:>7} {session.counts['EditMessageText']:>7}")
+
+    await dp.emit_shutdown()
+    bot_module.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--masters", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--orders", type=int, default=20)
+    parser.add_argument("--api-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    started = time.perf_counter()
+    asyncio.run(run(args))
+    print(f"\njami: {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Admin tarqatmasi: ko'p ustaga yuborish, xotira va restartdan keyin davom etish.
+
+    python bench/bench_broadcast.py [--masters 50000] [--kill-at 0.5]
+
+Bazaga N ta faol usta yoziladi, tarqatma yaratiladi va Broadcaster soxta
+sessiya orqali yuboradi. kill-at ulushida task bekor qilinadi (jarayon o'lgandek),
+keyin yangi Broadcaster DB dagi cursor dan davom ettiradi. Chiqadi: vaqt,
+yuborilgan xabarlar, takror yuborilganlar (uzilgan bo'lak) va tracemalloc cho'qqisi
+(faqat tarqatma davomida) - u N ga bog'liq bo'lmasligi kerak.
+"""
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+
+from _env import load_bot
+from fakebot import FakeSession, install
+
+
+async def run(args):
+    os.environ.setdefault("SEND_RATE", "1000000")
+    os.environ.setdefault("SEND_CHAT_INTERVAL", "0")
+    bot_module = load_bot()
+    first = 1_000_000
+    # tracemalloc dan oldin ajratiladi: o'lchovga benchmark hisobi kirmasin
+    received = bytearray(args.masters)
+
+    def record(method):
+        if type(method).__name__ == "SendMessage" and method.chat_id >= first:
+            received[method.chat_id - first] += 1
+        return False
+
+    session = install(bot_module.bot, FakeSession(keep=record))
+    await bot_module.init_db()
+
+    bot_module.write_sync(lambda conn: conn.executemany(
+        "INSERT INTO ustalar(user_id, name, phone, job, region) VALUES (?, 'Usta', '+998901234567', 'Elektrik', 'Asaka');",
+        ((uid,) for uid in range(first, first + args.masters))))
+    b = await bot_module.create_broadcast(1, "📣 Test e'lon", 0, 0)
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    broadcaster = bot_module.Broadcaster()
+    broadcaster.wake(publish=False)
+    while sum(received) < args.masters * args.kill_at:
+        await asyncio.sleep(0.01)
+    await broadcaster.stop()
+    killed_at = sum(received)
+
+    broadcaster = bot_module.Broadcaster()
+    broadcaster.wake(publish=False)
+    await broadcaster._task
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    b = bot_module.get_broadcast_sync(b["id"])
+    print(f"ustalar: {args.masters}, to'xtatildi: {killed_at} xabardan keyin")
+    print(f"holat: {b['status']}, sent={b['sent']}, failed={b['failed']}")
+    total = sum(received)
+    print(f"qabul qilganlar: {sum(1 for n in received if n)}, takror: {total - sum(1 for n in received if n)}")
+    print(f"vaqt: {elapsed:.2f}s ({total / elapsed:.0f} xabar/s)")
+    print(f"tracemalloc cho'qqisi: {peak / 1024:.0f} KiB")
+
+    await bot_module.dp.emit_shutdown()
+    bot_module.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--masters", type=int, default=50000)
+    parser.add_argument("--kill-at", type=float, default=0.5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""get_usta / set_usta_status: har chaqiruvda yangi ulanish vs doimiy ulanish.
+
+    python bench/bench_db.py [chaqiruvlar_soni]
+"""
+import asyncio
+import sqlite3
+import sys
+import time
+
+from _env import load_bot
+
+bot = load_bot()
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+USERS = 1000
+
+
+def legacy_get_usta(user_id):
+    conn = sqlite3.connect(bot.DB_PATH)
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT * FROM ustalar WHERE user_id=?;", (user_id,)).fetchone()
+    conn.close()
+    return row
+
+
+def legacy_set_status(user_id, status):
+    conn = sqlite3.connect(bot.DB_PATH)
+    conn.execute("UPDATE ustalar SET status=?, updated_at=datetime('now') WHERE user_id=?;", (status, user_id))
+    conn.commit()
+    conn.close()
+
+
+async def measure(name, call):
+    t0 = time.perf_counter()
+    for i in range(N):
+        await call(i % USERS)
+    dt = time.perf_counter() - t0
+    print(f"{name:<32} {dt / N * 1e6:9.1f} us/call")
+
+
+async def main():
+    await bot.init_db()
+    for uid in range(USERS):
+        bot.upsert_usta_sync(uid, f"Usta {uid}", "+998901234567", "Elektrik", "Andijon")
+
+    await measure("get_usta (open-per-call)", lambda uid: asyncio.to_thread(legacy_get_usta, uid))
+    await measure("get_usta (persistent)", lambda uid: bot.run_db(bot.get_usta_sync, uid))
+    await measure("set_status (open-per-call)", lambda uid: asyncio.to_thread(legacy_set_status, uid, "🔴 Bandman"))
+    await measure("set_status (persistent)", lambda uid: bot.run_db(bot.set_usta_status_sync, uid, "🔴 Bandman"))
+    bot.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
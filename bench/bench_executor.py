@@ -0,0 +1,121 @@
+"""Update executor: har bir update alohida task (aiogram polling) vs update_executor.
+
+    python bench/bench_executor.py [--users 1000] [--concurrency 100] [--backlog 6000] [--api-latency-ms 20]
+
+--users ta foydalanuvchi bir vaqtda usta ro'yxatidan o'tadi: hamma qadamlari
+(tugma, ism, telefon, kasb, hudud) bir zumda keladi - tez-tez bosish / burst.
+"tasks" - har bir update o'z taskida (eski polling), "executor" - foydalanuvchi
+bo'yicha ketma-ket, --concurrency ta handler. Chiqadi: ro'yxatdan to'g'ri o'tganlar
+(FSM poygasi bo'lmasa hammasi), bir vaqtdagi handlerlar va asyncio task lar cho'qqisi,
+update javob vaqti p50/p99 va umumiy vaqt. Oxirida --backlog dan ikki barobar katta
+burst: tashlangan update lar sababi bo'yicha (backlog - navbat to'la, stale -
+UPDATE_MAX_AGE dan ko'p kutgan).
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from _env import load_bot
+from fakebot import FakeSession, UpdateFactory, install
+from loadtest import percentile
+
+
+class Probe:
+    # dp.update outer middleware: bir vaqtdagi handlerlar, task lar va javob vaqti
+    def __init__(self):
+        self.submitted = {}
+        self.latencies = []
+        self.running = self.peak_running = self.peak_tasks = 0
+
+    async def __call__(self, handler, event, data):
+        self.running += 1
+        self.peak_running = max(self.peak_running, self.running)
+        self.peak_tasks = max(self.peak_tasks, len(asyncio.all_tasks()))
+        try:
+            return await handler(event, data)
+        finally:
+            self.running -= 1
+            self.latencies.append(time.perf_counter() - self.submitted.pop(event.update_id))
+
+
+def conversation(b, factory, uid):
+    return [factory.message(uid, text) for text in (b.BTN_USTA, f"Usta {uid}", "+998901234567", "Elektrik", "Asaka")]
+
+
+async def run(args):
+    os.environ.setdefault("SEND_RATE", "1000000")
+    os.environ.setdefault("SEND_CHAT_INTERVAL", "0")
+    os.environ["UPDATE_CONCURRENCY"] = str(args.concurrency)
+    os.environ["UPDATE_BACKLOG"] = str(args.backlog)
+    for cls in ("READ", "WRITE", "ADMIN", "DEFAULT"):
+        os.environ.setdefault(f"THROTTLE_{cls}", "1000000/1000000")
+    b = load_bot()
+    dp, bot = b.dp, b.bot
+    install(bot, FakeSession(latency=args.api_latency_ms / 1000))
+    await b.init_db()
+    await dp.emit_startup(bot=bot)
+    factory = UpdateFactory()
+    probe = Probe()
+    conn = b.db_connect()
+    dp.update.outer_middleware(probe)
+
+    print(f"foydalanuvchilar: {args.users}, concurrency: {args.concurrency}, API: {args.api_latency_ms} ms")
+    print(f"{'rejim':<9} {'to`g`ri':>8} {'handler':>8} {'tasks':>7} {'p50 ms':>9} {'p99 ms':>9} {'sek':>6}")
+    first = 1_000_000
+    for mode in ("tasks", "executor"):
+        users = range(first, first + args.users)
+        first += args.users
+        probe.latencies.clear()
+        probe.peak_running = probe.peak_tasks = 0
+        tasks = set()
+        t0 = time.perf_counter()
+        for uid in users:
+            for update in conversation(b, factory, uid):
+                probe.submitted[update.update_id] = time.perf_counter()
+                if mode == "executor":
+                    b.update_executor.submit(update)
+                else:
+                    tasks.add(asyncio.create_task(dp.feed_update(bot, update)))
+        if tasks:
+            await asyncio.wait(tasks)
+        await b.update_executor.drain()
+        elapsed = time.perf_counter() - t0
+        registered = conn.execute(
+            "SELECT count(*) FROM ustalar WHERE user_id BETWEEN ? AND ? AND name = 'Usta ' || user_id AND region <> '';",
+            (users[0], users[-1])).fetchone()[0]
+        print(f"{mode:<9} {registered:>8} {probe.peak_running:>8} {probe.peak_tasks:>7} "
+              f"{percentile(probe.latencies, .5) * 1e3:9.1f} {percentile(probe.latencies, .99) * 1e3:9.1f} {elapsed:6.2f}")
+
+    shed_before = dict(b.UPDATES_SHED._values)
+    b.log.setLevel(logging.ERROR)  # har bir tashlangan update uchun warning - burstda minglab
+    burst = args.backlog * 2
+    t0 = time.perf_counter()
+    for i in range(burst):
+        update = factory.message(first + i, "/myid")
+        probe.submitted[update.update_id] = time.perf_counter()
+        if not b.update_executor.submit(update):
+            del probe.submitted[update.update_id]
+    await b.update_executor.drain()
+    shed = {key[0]: n - shed_before.get(key, 0) for key, n in b.UPDATES_SHED._values.items()}
+    print(f"\nburst {burst} (backlog {args.backlog}): qayta ishlandi {burst - sum(shed.values()):.0f}, "
+          f"tashlandi {', '.join(f'{reason}={n:.0f}' for reason, n in sorted(shed.items()))}, "
+          f"{time.perf_counter() - t0:.2f}s")
+
+    conn.close()
+    await dp.emit_shutdown(bot=bot)
+    b.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--backlog", type=int, default=6000)
+    parser.add_argument("--api-latency-ms", type=float, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""100k ta tashlab ketilgan suhbat: MemoryStorage vs SQLiteStorage (RSS o'sishi).
+
+    python bench/bench_fsm_storage.py [suhbatlar_soni]
+"""
+import asyncio
+import os
+import sys
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from _env import load_bot
+
+bot = load_bot()
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+async def fill(storage, offset):
+    # har bir user UstaReg ni yarmida tashlab ketgan
+    for uid in range(offset, offset + N):
+        key = StorageKey(bot_id=1, chat_id=uid, user_id=uid)
+        await storage.set_state(key, bot.UstaReg.phone.state)
+        await storage.update_data(key, {"name": f"Usta {uid}"})
+        await storage.update_data(key, {"phone": "+998901234567"})
+
+
+async def run(name, storage, offset):
+    before = rss_mb()
+    t0 = time.perf_counter()
+    await fill(storage, offset)
+    if isinstance(storage, bot.SQLiteStorage):
+        await storage.flush()
+    dt = time.perf_counter() - t0
+    print(f"{name:<14} {N} suhbat: {dt / N * 1e6:7.1f} us/suhbat, RSS +{rss_mb() - before:6.1f} MB")
+
+
+async def main():
+    await bot.init_db()
+    # SQLiteStorage birinchi: MemoryStorage ajratgan xotira RSS ga qaytmaydi
+    await run("SQLiteStorage", bot.SQLiteStorage(), 0)
+    await run("SQLiteStorage", bot.SQLiteStorage(), N)
+    await run("MemoryStorage", MemoryStorage(), 2 * N)
+
+    storage = bot.SQLiteStorage()
+    key = StorageKey(bot_id=1, chat_id=7, user_id=7)
+    print("restartdan keyin:", await storage.get_state(key), await storage.get_data(key))
+    bot.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
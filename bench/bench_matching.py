@@ -0,0 +1,61 @@
+"""find_matching_ustalar: eski LIKE so'rovi vs taksonomiya (usta_categories butun son join).
+
+    python bench/bench_matching.py [hajm ...]
+"""
+import random
+import sys
+import time
+
+from _env import load_bot
+
+bot = load_bot()
+SIZES = [int(a) for a in sys.argv[1:]] or [1_000, 10_000, 100_000]
+JOBS = [
+    "Elektrik", "Santexnik", "Payvandchi", "Duradgor", "Kafelchi", "Bo‘yoqchi", "Konditsioner ustasi",
+    "Электрик", "Сантехник", "Gipsokarton", "Tom yopuvchi", "Maishiy texnika ustasi", "Quruvchi", "Shpaklyovka",
+]
+REGIONS = [
+    "Andijon", "Asaka", "Shahrixon", "Xo‘jaobod", "Marhamat", "Andijon, Asaka", "Qo‘rg‘ontepa", "Toshkent",
+    "Baliqchi", "Bo‘z", "Buloqboshi", "Izboskan", "Jalaquduq", "Oltinko‘l", "Paxtaobod", "Ulug‘nor",
+    "Xonobod", "Qorasuv", "Farg‘ona", "Namangan", "Marg‘ilon", "Qo‘qon", "Chust", "Kosonsoy",
+]
+QUERIES = [("elektrik", "asaka"), ("Santexnik", "Shahrixon"), ("kafel", "Xo'jaobod"), ("payvand", "Toshkent")]
+REPEAT = 200
+
+
+def legacy_find(conn, ish_turi, region, limit=10):
+    return conn.execute("""
+    SELECT user_id, name, phone, job, region, status
+    FROM ustalar
+    WHERE is_active=1
+      AND lower(job) LIKE '%' || lower(?) || '%'
+      AND lower(region) LIKE '%' || lower(?) || '%'
+    ORDER BY updated_at DESC
+    LIMIT ?;
+    """, (ish_turi, region, limit)).fetchall()
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    for i in range(REPEAT):
+        fn(*QUERIES[i % len(QUERIES)])
+    return (time.perf_counter() - t0) / REPEAT * 1e3
+
+
+def main():
+    bot.init_db_sync()
+    conn = bot.db_connect()
+    rnd = random.Random(1)
+    have = 0
+    print(f"{'ustalar':>8} {'LIKE ms':>9} {'join ms':>9}")
+    for size in SIZES:
+        for uid in range(have, size):
+            bot.upsert_usta_sync(uid, f"Usta {uid}", "+998901234567", rnd.choice(JOBS), rnd.choice(REGIONS))
+        have = size
+        like_ms = timed(lambda j, r: legacy_find(conn, j, r))
+        join_ms = timed(lambda j, r: bot.find_matching_ustalar_sync(j, r))
+        print(f"{size:>8} {like_ms:9.3f} {join_ms:9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Metrika middleware larining hot path dagi narxi.
+
+    python bench/bench_metrics.py [update_soni]
+"""
+import asyncio
+import os
+import sys
+import time
+
+from _env import load_bot
+from fakebot import FakeSession, UpdateFactory, install
+
+# throttle /myid larni tashlamasin, javoblar send limitini kutmasin: middleware narxi o'lchanadi
+os.environ.setdefault("SEND_RATE", "1000000")
+os.environ.setdefault("SEND_CHAT_INTERVAL", "0")
+for cls in ("READ", "WRITE", "ADMIN", "DEFAULT"):
+    os.environ.setdefault(f"THROTTLE_{cls}", "1000000/1000000")
+bot_module = load_bot()
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+METRIC_TYPES = (
+    bot_module.UpdateMetricsMiddleware,
+    bot_module.HandlerMetricsMiddleware,
+    bot_module.OutboundMetricsMiddleware,
+)
+
+
+def strip_metrics(manager):
+    for middleware in list(manager):
+        if isinstance(middleware, METRIC_TYPES):
+            manager.unregister(middleware)
+
+
+async def feed(dp, bot, updates):
+    t0 = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - t0) / len(updates) * 1e6
+
+
+async def main():
+    dp, bot = bot_module.dp, bot_module.bot
+    install(bot, FakeSession())
+    await bot_module.init_db()
+    factory = UpdateFactory()
+
+    # /myid: DB ga tegmaydigan eng arzon handler, middleware ulushi eng ko'p ko'rinadi
+    def updates():
+        return [factory.message(1000 + i % 100, "/myid") for i in range(N)]
+
+    await feed(dp, bot, updates()[:1000])  # isitish
+    with_metrics = min([await feed(dp, bot, updates()) for _ in range(3)])
+    strip_metrics(dp.update.outer_middleware)
+    strip_metrics(dp.message.middleware)
+    strip_metrics(dp.callback_query.middleware)
+    strip_metrics(bot.session.middleware)
+    without_metrics = min([await feed(dp, bot, updates()) for _ in range(3)])
+
+    hist = bot_module.MetricHistogram("bench_seconds", "bench")
+    t0 = time.perf_counter()
+    for i in range(N):
+        hist.observe(0.003, "x")
+    observe_ns = (time.perf_counter() - t0) / N * 1e9
+
+    print(f"feed_update /myid, metrikalar bilan:  {with_metrics:8.1f} us")
+    print(f"feed_update /myid, metrikalarsiz:     {without_metrics:8.1f} us")
+    print(f"ortiqcha narx:                        {with_metrics - without_metrics:8.1f} us/update "
+          f"({(with_metrics / without_metrics - 1) * 100:.1f}%)")
+    print(f"MetricHistogram.observe:              {observe_ns:8.0f} ns")
+    bot_module.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
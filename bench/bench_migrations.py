@@ -0,0 +1,90 @@
+"""Startup vaqti (migratsiyalar) va hot so'rovlar indeks ishlatishini tekshirish.
+
+    python bench/bench_migrations.py
+
+Har bir hot helper bir marta chaqiriladi, SQLite trace orqali ushlangan har
+bir SELECT/UPDATE/DELETE uchun EXPLAIN QUERY PLAN olinadi. Indekssiz to'liq
+jadval skani (masalan "SCAN buyurtmalar") bo'lsa, skript xato bilan tugaydi.
+"""
+import re
+import sys
+import time
+
+from _env import load_bot
+
+bot = load_bot()
+FULL_SCAN_RE = re.compile(r"^SCAN (?:\w+\.)?(\w+)$")
+# (helper, jadval): rowid tartibida LIMIT bilan o'qish - "SCAN" ko'rinadi, lekin faqat
+# LIMIT qator o'qiladi. Helper ning boshqa jadvallaridagi skan baribir xato.
+ROWID_ORDERED = {("list_buyurtmalar_page", "buyurtmalar")}
+# kichik xizmat jadvali: oyiga bitta qator
+SMALL_TABLES = {"archive_index"}
+
+
+def hot_calls():
+    yield "get_usta", lambda: bot.get_usta_sync(1)
+    yield "upsert_usta", lambda: bot.upsert_usta_sync(1, "Ali", "+998901234567", "Elektrik", "Asaka")
+    yield "set_usta_status", lambda: bot.set_usta_status_sync(1, "🔴 Bandman")
+    yield "set_usta_active", lambda: bot.set_usta_active_sync(1, 1)
+    yield "find_matching_ustalar", lambda: bot.find_matching_ustalar_sync("elektrik", "asaka")
+    yield "list_ustalar_page", lambda: bot.list_ustalar_page_sync(None)
+    yield "list_ustalar_page next", lambda: bot.list_ustalar_page_sync(("2026-01-01 00:00:00", 5), "next")
+    yield "list_ustalar_page prev", lambda: bot.list_ustalar_page_sync(("2026-01-01 00:00:00", 5), "prev")
+    yield "insert_buyurtma", lambda: bot.insert_buyurtma_sync(2, "Elektrik", "Asaka", "+998901234567", "", [1], 0)
+    yield "scheduled_orders", lambda: bot.scheduled_orders_sync()
+    yield "redispatch_order", lambda: bot.write_sync(bot.redispatch_order_tx, 1, time.time())
+    yield "pending_deliveries", lambda: bot.pending_deliveries_sync(time.time())
+    yield "next_delivery_at", lambda: bot.next_delivery_at_sync()
+    yield "get_buyurtma", lambda: bot.get_buyurtma_sync(1)
+    yield "accept_buyurtma", lambda: bot.accept_buyurtma_sync(1, 1)
+    yield "list_buyurtmalar_page", lambda: bot.list_buyurtmalar_page_sync(None)
+    yield "list_buyurtmalar_page next", lambda: bot.list_buyurtmalar_page_sync(10, "next")
+    yield "list_buyurtmalar_page prev", lambda: bot.list_buyurtmalar_page_sync(10, "prev")
+    yield "archive_cutoff", lambda: bot.archive_cutoff_sync(bot.ARCHIVE_AGE_DAYS)
+    yield "archive_copy", lambda: bot.archive_copy_sync(bot.ARCHIVE_AGE_DAYS, 0, 10)
+    yield "admin_stats", lambda: bot.admin_stats_sync()
+    yield "broadcast_audience", lambda: bot.broadcast_audience_sync()
+    yield "create_broadcast", lambda: bot.write_sync(bot.create_broadcast_tx, 1, "x", 1, 1)
+    yield "running_broadcast", lambda: bot.running_broadcast_sync()
+    yield "broadcast_recipients", lambda: bot.broadcast_recipients_sync(0)
+    yield "broadcast_progress", lambda: bot.write_sync(bot.broadcast_progress_tx, 1, 5, 1, 0)
+    yield "fsm_load", lambda: bot.fsm_load_sync("1:1:1:0:default")
+    yield "fsm_purge", lambda: bot.write_sync(bot.fsm_purge_tx, 0)
+
+
+def check_plans(conn):
+    failures = 0
+    for name, call in hot_calls():
+        statements = []
+        conn.set_trace_callback(statements.append)
+        call()
+        conn.set_trace_callback(None)
+        for sql in statements:
+            if not re.match(r"\s*(SELECT|UPDATE|DELETE|INSERT)", sql, re.I):
+                continue
+            plan = [r["detail"] for r in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+            helper = name.split()[0]
+            scans = [d for d in plan if FULL_SCAN_RE.match(d)
+                     and (helper, FULL_SCAN_RE.match(d).group(1)) not in ROWID_ORDERED
+                     and FULL_SCAN_RE.match(d).group(1) not in SMALL_TABLES]
+            status = "FAIL" if scans else "ok"
+            failures += bool(scans)
+            print(f"{status:<4} {name:<28} {' / '.join(plan) or '-'}")
+    return failures
+
+
+def main():
+    t0 = time.perf_counter()
+    bot.init_db_sync()
+    print(f"bo'sh DB, barcha migratsiyalar: {(time.perf_counter() - t0) * 1000:.1f} ms")
+    t0 = time.perf_counter()
+    bot.init_db_sync()
+    print(f"migratsiya qilingan DB qayta ochilishi: {(time.perf_counter() - t0) * 1000:.2f} ms\n")
+
+    failures = check_plans(bot.db_connect())
+    bot.close_db()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Katta fan-out paytida interaktiv javoblar kechikishi: yo'laklar vs bitta FIFO navbat.
+
+    python bench/bench_outbound.py [--fanout 3000] [--users 20] [--rate 100] [--duration 10]
+
+Bitta buyurtma --fanout ta ustaga outbox (DeliveryDispatcher, bulk yo'lak) orqali
+yuborilayotganda --users ta foydalanuvchi har 0.5 s da /myid yuboradi (interactive).
+Umumiy limit --rate xabar/s (haqiqiy OutboundScheduler, soxta sessiya 5 ms).
+"lanes" - odatdagi ustuvorlik, "fifo" - hamma yo'lak bir xil ustuvorlikda.
+Interaktiv javob vaqti (feed_update) p50/p95/p99 va shu oynada ketgan bulk xabarlar.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from _env import load_bot
+from fakebot import FakeSession, UpdateFactory, install
+from loadtest import percentile
+
+
+async def interactive(bot_module, factory, user_id, offset, until, samples):
+    dp, bot = bot_module.dp, bot_module.bot
+    await asyncio.sleep(offset)  # foydalanuvchilar bir vaqtda emas, tekis
+    while time.perf_counter() < until:
+        started = time.perf_counter()
+        await dp.feed_update(bot, factory.message(user_id, "/myid"))
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(max(0.0, 0.5 - (time.perf_counter() - started)))
+
+
+async def run(args):
+    os.environ["SEND_RATE"] = str(args.rate)
+    os.environ.setdefault("SEND_CHAT_INTERVAL", "1")
+    for cls in ("READ", "WRITE", "ADMIN", "DEFAULT"):
+        os.environ.setdefault(f"THROTTLE_{cls}", "1000000/1000000")
+    bot_module = load_bot()
+    session = install(bot_module.bot, FakeSession(latency=0.005))
+    await bot_module.init_db()
+    factory = UpdateFactory()
+
+    print(f"fan-out: {args.fanout}, foydalanuvchilar: {args.users}, limit: {args.rate}/s, oyna: {args.duration}s")
+    print(f"{'rejim':<6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'bulk':>6}")
+    first_usta = 1_000_000
+    for mode in ("lanes", "fifo"):
+        if mode == "fifo":
+            bot_module.outbound.priority = dict.fromkeys(bot_module.LANE_PRIORITY, 0)
+        usta_ids = list(range(first_usta, first_usta + args.fanout))
+        first_usta += args.fanout
+        bot_module.insert_buyurtma_sync(1, "Elektrik", "Asaka", "+998911112233", "", usta_ids)
+        session.counts.clear()
+        samples = []
+        bot_module.delivery_dispatcher.wake(publish=False)
+        await asyncio.sleep(0.5)  # fan-out boshlansin
+        until = time.perf_counter() + args.duration
+        await asyncio.gather(*(interactive(bot_module, factory, 10 + u, u * 0.5 / args.users, until, samples)
+                               for u in range(args.users)))
+        bulk = session.counts["SendMessage"] - len(samples)
+        await bot_module.delivery_dispatcher.stop(timeout=0)
+        # qolgan yetkazishlar keyingi rejimga o'tmasin
+        bot_module.write_sync(lambda conn: conn.execute(
+            "UPDATE order_deliveries SET status='skipped' WHERE status='pending';"))
+        print(f"{mode:<6} {percentile(samples, .5) * 1e3:9.1f} {percentile(samples, .95) * 1e3:9.1f} "
+              f"{percentile(samples, .99) * 1e3:9.1f} {max(samples) * 1e3:9.1f} {bulk:>6}")
+
+    await bot_module.dp.emit_shutdown()
+    bot_module.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fanout", type=int, default=3000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=100)
+    parser.add_argument("--duration", type=float, default=10)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Ko'p jarayonli rejim: 1, 2, 4, 8 worker da update/s.
+
+    python bench/bench_workers.py [--workers 1 2 4 8] [--users 1000]
+
+Haqiqiy WorkerPool (spawn qilingan jarayonlar, soxta Bot sessiyasi bilan) ishga
+tushiriladi. Har bir foydalanuvchi usta sifatida ro'yxatdan o'tadi va holatini
+almashtiradi; update lar bosqichma-bosqich (hamma 1-qadam, keyin 2-qadam...)
+supervisor orqali route qilinadi va hammasi qayta ishlanguncha vaqt o'lchanadi.
+Natija mashinadagi yadrolar soniga bog'liq (os.cpu_count() chiqariladi).
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from _env import load_bot
+from fakebot import FakeSession, UpdateFactory, install
+
+JOBS = ["Elektrik", "Santexnik", "Payvandchi", "Duradgor", "Kafelchi"]
+REGIONS = ["Andijon", "Asaka", "Shahrixon", "Marhamat", "Baliqchi"]
+
+
+def install_fake_session(bot):
+    # worker jarayonida chaqiriladi (spawn: modul nomi bo'yicha pickle qilinadi)
+    install(bot, FakeSession())
+
+
+def build_updates(bot_module, first_user, users, seed):
+    rnd = random.Random(seed)
+    factory = UpdateFactory()
+    b = bot_module
+    conversations = [
+        (uid, [b.BTN_USTA, f"Usta {uid}", "+998901234567", rnd.choice(JOBS), rnd.choice(REGIONS),
+               b.BTN_BUSY, b.BTN_FREE, b.BTN_MY_PROFILE])
+        for uid in range(first_user, first_user + users)
+    ]
+    updates = []
+    for step in range(len(conversations[0][1])):
+        for uid, texts in conversations:
+            raw = factory.message(uid, texts[step]).model_dump_json(by_alias=True, exclude_none=True)
+            updates.append((raw.encode(), uid))
+    return updates
+
+
+async def run(args):
+    os.environ.setdefault("SEND_RATE", "1000000")
+    os.environ.setdefault("SEND_CHAT_INTERVAL", "0")
+    for cls in ("READ", "WRITE", "ADMIN", "DEFAULT"):
+        os.environ.setdefault(f"THROTTLE_{cls}", "1000000/1000000")
+    bot_module = load_bot()
+    bot_module.init_db_sync()  # supervisor kabi: migratsiya workerlardan oldin
+
+    print(f"CPU: {os.cpu_count()}")
+    print(f"{'workers':>8} {'updates':>8} {'sek':>7} {'update/s':>9}")
+    first_user = 1_000_000
+    for count in args.workers:
+        updates = build_updates(bot_module, first_user, args.users, args.seed)
+        first_user += args.users
+        pool = bot_module.WorkerPool(count, setup=install_fake_session)
+        pool.start()
+        await pool.flush()  # workerlar tayyor
+
+        t0 = time.perf_counter()
+        for raw, uid in updates:
+            pool.route(raw, uid)
+        await pool.flush()
+        elapsed = time.perf_counter() - t0
+        print(f"{count:>8} {len(updates):>8} {elapsed:7.2f} {len(updates) / elapsed:9.0f}")
+        await pool.stop()
+    bot_module.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
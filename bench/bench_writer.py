@@ -0,0 +1,44 @@
+"""Yozuvlar/soniya: har chaqiruvda commit vs yagona yozuvchi (group commit).
+
+    python bench/bench_writer.py [soniya]
+"""
+import asyncio
+import sys
+import time
+
+from _env import load_bot
+
+bot = load_bot()
+DURATION = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+USERS = 1000
+STATUSES = ("🟢 Bo‘shman", "🔴 Bandman")
+
+
+async def writer(uid, write, deadline):
+    n = 0
+    while time.perf_counter() < deadline:
+        await write(uid, STATUSES[n % 2])
+        n += 1
+    return n
+
+
+async def measure(name, write, concurrency):
+    deadline = time.perf_counter() + DURATION
+    counts = await asyncio.gather(*(writer(i % USERS, write, deadline) for i in range(concurrency)))
+    print(f"{name:<22} {concurrency:>4} writers {sum(counts) / DURATION:10.0f} writes/s")
+
+
+async def main():
+    await bot.init_db()
+    for uid in range(USERS):
+        bot.upsert_usta_sync(uid, f"Usta {uid}", "+998901234567", "Elektrik", "Andijon")
+
+    for concurrency in (1, 10, 100):
+        await measure("commit per call", lambda uid, st: bot.run_db(bot.set_usta_status_sync, uid, st), concurrency)
+        await measure("group commit", lambda uid, st: bot.db_write(bot.set_usta_status_tx, uid, st), concurrency)
+    print(f"group commit: {bot.db_writer.writes} writes in {bot.db_writer.batches} batches")
+    bot.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""Telegramga chiqmaydigan Bot sessiyasi va sintetik Update yasovchilar."""
+import asyncio
+import itertools
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, List, Optional
+
+from aiogram.client.session.base import BaseSession
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+
+class FakeSession(BaseSession):
+    """Chiqayotgan API chaqiruvlarini yozib oladi, Telegramga yubormaydi."""
+
+    def __init__(self, latency: float = 0.0, keep: Optional[Callable[[Any], bool]] = None):
+        super().__init__()
+        self.latency = latency
+        self.keep = keep  # qaysi chaqiruvlar calls ga yozib qo'yilsin
+        self.calls: List[Any] = []
+        self.counts: Counter = Counter()
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        self.counts[type(method).__name__] += 1
+        if self.keep is not None and self.keep(method):
+            self.calls.append(method)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method.__returning__ is Message:
+            chat_id = int(getattr(method, "chat_id", 0) or 0)
+            return Message(
+                message_id=next(self._message_ids),
+                date=datetime.now(),
+                chat=Chat(id=chat_id, type="private"),
+                text=getattr(method, "text", None),
+            )
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def install(bot, session: BaseSession) -> BaseSession:
+    """bot.session ni almashtiradi, bot.py qo'shgan request middleware larni saqlab."""
+    for middleware in bot.session.middleware:
+        session.middleware(middleware)
+    bot.session = session
+    return session
+
+
+class UpdateFactory:
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> User:
+        return User(id=user_id, is_bot=False, first_name=f"u{user_id}")
+
+    def message(self, user_id: int, text: str) -> Update:
+        return Update(
+            update_id=next(self._ids),
+            message=Message(
+                message_id=next(self._ids),
+                date=datetime.now(),
+                chat=Chat(id=user_id, type="private"),
+                from_user=self._user(user_id),
+                text=text,
+            ),
+        )
+
+    def callback(self, user_id: int, data: str, message_id: Optional[int] = None) -> Update:
+        return Update(
+            update_id=next(self._ids),
+            callback_query=CallbackQuery(
+                id=str(next(self._ids)),
+                from_user=self._user(user_id),
+                chat_instance=str(user_id),
+                data=data,
+                message=Message(
+                    message_id=message_id or next(self._ids),
+                    date=datetime.now(),
+                    chat=Chat(id=user_id, type="private"),
+                    text="-",
+                ),
+            ),
+        )
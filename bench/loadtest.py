@@ -0,0 +1,142 @@
+"""Haqiqiy Dispatcher ni soxta Bot sessiyasi orqali yuklash (Telegramsiz).
+
+    python bench/loadtest.py --masters 2000 --customers 2000 [--api-latency-ms 0]
+
+Bosqichlar: ustalar ro'yxatdan o'tadi va holatini almashtiradi, buyurtmachilar
+buyurtma beradi, ustalar o'zlariga kelgan buyurtmalarni "Qabul qildim" qiladi.
+Har bir handler uchun p50/p95/p99, update/s va eng yuqori RSS chiqariladi.
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import time
+from collections import defaultdict
+
+from _env import load_bot
+from fakebot import FakeSession, UpdateFactory, install
+
+JOBS = ["Elektrik", "Santexnik", "Payvandchi", "Duradgor", "Kafelchi", "Konditsioner ustasi"]
+REGIONS = ["Andijon", "Asaka", "Shahrixon", "Xo‘jaobod", "Marhamat", "Baliqchi", "Izboskan", "Qo‘rg‘ontepa"]
+
+
+def accept_buttons(method):
+    markup = getattr(method, "reply_markup", None)
+    for row in getattr(markup, "inline_keyboard", None) or []:
+        for button in row:
+            if (button.callback_data or "").startswith("accept:"):
+                yield button.callback_data
+
+
+def has_accept_button(method):
+    return any(True for _ in accept_buttons(method))
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class HandlerTimer:
+    """Ichki middleware: qaysi handler qancha vaqt olganini yozadi."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    async def __call__(self, handler, event, data):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            name = data["handler"].callback.__name__
+            self.samples[name].append(time.perf_counter() - started)
+
+
+async def run(args):
+    # benchmark bot kodini o'lchaydi, Telegram limitlarini emas
+    os.environ.setdefault("SEND_RATE", "1000000")
+    os.environ.setdefault("SEND_CHAT_INTERVAL", "0")
+    for cls in ("READ", "WRITE", "ADMIN", "DEFAULT"):
+        os.environ.setdefault(f"THROTTLE_{cls}", "1000000/1000000")
+    bot_module = load_bot()
+    dp, bot = bot_module.dp, bot_module.bot
+    session = install(bot, FakeSession(latency=args.api_latency_ms / 1000, keep=has_accept_button))
+    timer = HandlerTimer()
+    dp.message.middleware(timer)
+    dp.callback_query.middleware(timer)
+    await bot_module.init_db()
+
+    factory = UpdateFactory()
+    rnd = random.Random(args.seed)
+    fed = 0
+
+    async def conversation(user_id, steps):
+        nonlocal fed
+        for text in steps:
+            await dp.feed_update(bot, factory.message(user_id, text))
+            fed += 1
+
+    masters = range(1_000_000, 1_000_000 + args.masters)
+    customers = range(2_000_000, 2_000_000 + args.customers)
+    b = bot_module
+
+    phases = [
+        ("ustalar ro'yxatdan o'tadi", [
+            conversation(uid, [b.BTN_USTA, f"Usta {uid}", "+998901234567", rnd.choice(JOBS), rnd.choice(REGIONS),
+                               b.BTN_BUSY, b.BTN_FREE, b.BTN_MY_PROFILE])
+            for uid in masters
+        ]),
+        ("buyurtmachilar buyurtma beradi", [
+            conversation(uid, [b.BTN_BUYURT, rnd.choice(JOBS), rnd.choice(REGIONS), "+998911112233", "-"])
+            for uid in customers
+        ]),
+    ]
+
+    started = time.perf_counter()
+    for title, tasks in phases:
+        t0 = time.perf_counter()
+        await asyncio.gather(*tasks)
+        print(f"{title}: {time.perf_counter() - t0:.2f}s")
+    # outbox bo'shaguncha kutamiz (yuborish fonda)
+    while bot_module.next_delivery_at_sync() is not None:
+        await asyncio.sleep(0.05)
+
+    # usta o'ziga kelgan "Qabul qildim" tugmasini bosadi
+    offers = [(int(call.chat_id), data) for call in session.calls for data in accept_buttons(call)]
+    rnd.shuffle(offers)
+
+    async def accept(user_id, data):
+        nonlocal fed
+        await dp.feed_update(bot, factory.callback(user_id, data))
+        fed += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(accept(uid, data) for uid, data in offers))
+    print(f"ustalar qabul qiladi ({len(offers)} taklif): {time.perf_counter() - t0:.2f}s")
+    total = time.perf_counter() - started
+
+    print(f"\n{'handler':<22} {'n':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, values in sorted(timer.samples.items()):
+        print(f"{name:<22} {len(values):>7} {percentile(values, .5) * 1e3:9.2f} "
+              f"{percentile(values, .95) * 1e3:9.2f} {percentile(values, .99) * 1e3:9.2f}")
+    print(f"\nupdates: {fed}, {fed / total:.0f} updates/s")
+    print(f"API calls: {dict(session.counts)}")
+    print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+    await dp.emit_shutdown()
+    bot_module.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--masters", type=int, default=2000)
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--api-latency-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Yozib olingan update trafigini qayta o'ynash va kechikishlarni o'lchash.
+
+    TRACE_PATH=trace.jsonl python bot.py           # yozib olish (production)
+    python bench/replay.py trace.jsonl [trace.jsonl.1 ...] [--db ustaxizmati.db]
+        [--speed 1 | --fast] [--concurrency 200] [--api-latency-ms 0]
+
+Bir nechta fayl (rotatsiya qilingan yoki worker fayllari) vaqt bo'yicha oqim
+sifatida birlashtiriladi. --db berilsa, uning nusxasi ishlatiladi (asl fayl
+o'zgarmaydi), aks holda bo'sh DB. Update lar dp.feed_raw_update ga soxta Bot
+sessiyasi orqali beriladi: --speed bilan yozilgandagi vaqt oralig'ida (2 - ikki
+barobar tez), --fast bilan imkon qadar tez. Bitta foydalanuvchining update lari
+ketma-ket (production dagi kabi), turli foydalanuvchilarniki parallel.
+
+Chiqadi: javob (update kelgan rejadagi vaqtdan qayta ishlanguncha) va har bir
+handler uchun p50/p95/p99/max, rejadan kechikish (lag) va update/s.
+Trace dagi ID lar anonim: DB nusxasidagi ustalar bilan mos kelmaydi, DB hajm va
+moslashtirish to'plamlari uchun xizmat qiladi.
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from _env import load_bot
+from fakebot import FakeSession, install
+from loadtest import HandlerTimer, percentile
+
+
+def read_trace(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                yield entry["t"], entry["update"]
+
+
+def copy_db(src):
+    dst = Path(tempfile.mkdtemp(prefix="ustaxizmati-replay-")) / "replay.db"
+    source = sqlite3.connect(f"file:{src}?mode=ro", uri=True)
+    target = sqlite3.connect(dst)
+    source.backup(target)
+    target.close()
+    source.close()
+    return dst
+
+
+def user_of(update):
+    for key, value in update.items():
+        if key != "update_id" and isinstance(value, dict):
+            user = value.get("from") or value.get("user")
+            if user:
+                return user["id"]
+    return 0
+
+
+def row(name, values):
+    return (f"{name:<28} {len(values):>7} {percentile(values, .5) * 1e3:9.2f} {percentile(values, .95) * 1e3:9.2f} "
+            f"{percentile(values, .99) * 1e3:9.2f} {max(values, default=0) * 1e3:9.2f}")
+
+
+async def run(args):
+    os.environ.setdefault("SEND_RATE", "1000000")
+    os.environ.setdefault("SEND_CHAT_INTERVAL", "0")
+    for cls in ("READ", "WRITE", "ADMIN", "DEFAULT"):
+        os.environ.setdefault(f"THROTTLE_{cls}", "1000000/1000000")
+    os.environ.pop("TRACE_PATH", None)
+    bot_module = load_bot(copy_db(args.db) if args.db else None)
+    dp, bot = bot_module.dp, bot_module.bot
+    install(bot, FakeSession(latency=args.api_latency_ms / 1000))
+    timer = HandlerTimer()
+    dp.message.middleware(timer)
+    dp.callback_query.middleware(timer)
+    await bot_module.init_db()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    tails = {}
+    latencies, lags = [], []
+    errors = 0
+
+    async def feed(update, due, prev):
+        nonlocal errors
+        if prev is not None:
+            await asyncio.wait([prev])
+        async with semaphore:
+            try:
+                await dp.feed_raw_update(bot, update)
+            except Exception:
+                errors += 1
+        latencies.append(time.perf_counter() - due)
+
+    entries = heapq.merge(*(read_trace(p) for p in args.trace), key=lambda e: e[0])
+    started = time.perf_counter()
+    first_t = None
+    count = 0
+    for t, update in entries:
+        first_t = t if first_t is None else first_t
+        due = time.perf_counter() if args.fast else started + (t - first_t) / args.speed
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        lags.append(max(0.0, time.perf_counter() - due))
+        uid = user_of(update)
+        task = asyncio.create_task(feed(update, due, tails.get(uid)))
+        tails[uid] = task
+        task.add_done_callback(lambda done, uid=uid: tails.pop(uid, None) if tails.get(uid) is done else None)
+        count += 1
+        if len(tails) >= args.concurrency * 4:
+            # o'qish oldinga ketib qolmasin (xotira): kutayotgan vazifalar kamayguncha
+            await asyncio.wait(list(tails.values()), return_when=asyncio.FIRST_COMPLETED)
+    while tails:
+        await asyncio.wait(list(tails.values()))
+    elapsed = time.perf_counter() - started
+
+    print(f"{'':<28} {'soni':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    print(row("javob (update)", latencies))
+    if not args.fast:
+        print(row("lag (rejadan kechikish)", lags))
+    for name, values in sorted(timer.samples.items()):
+        print(row(name, values))
+    print(f"\nupdates: {count}, {count / elapsed:.0f} updates/s, xato: {errors}, {elapsed:.1f}s")
+
+    await dp.emit_shutdown()
+    bot_module.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("trace", nargs="+")
+    parser.add_argument("--db", help="ustaxizmati.db (nusxasi ishlatiladi)")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--fast", action="store_true")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--api-latency-ms", type=float, default=0.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
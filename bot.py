@@ -1,19 +1,49 @@
 import asyncio
+import bisect
+import difflib
+import gc
+import hashlib
+import heapq
+import hmac
+import itertools
+import json
+import logging
+import logging.handlers
+import multiprocessing
 import re
+import resource
+import signal
 import sqlite3
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple, Union
 from datetime import datetime
 
-from aiogram import Bot, Dispatcher, F
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot, Dispatcher, F, __version__ as AIOGRAM_VERSION
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.exceptions import (
+    TelegramAPIError, TelegramConflictError, TelegramForbiddenError, TelegramRetryAfter, TelegramUnauthorizedError,
+)
 from aiogram.filters import Command
 from aiogram.types import (
     Message, ReplyKeyboardMarkup, KeyboardButton,
-    InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+    InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, BufferedInputFile, Update
 )
+from aiogram.types.update import UpdateTypeLookupError
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.utils.backoff import Backoff, BackoffConfig
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 # ----------------- SETTINGS -----------------
 import os
@@ -24,7 +54,164 @@ if not TOKEN:
     raise RuntimeError("BOT_TOKEN environment variable not set")
 
 BASE_DIR = Path(__file__).resolve().parent
-DB_PATH = BASE_DIR / "ustaxizmati.db"
+DB_PATH = Path(os.getenv("DB_PATH", BASE_DIR / "ustaxizmati.db"))
+
+# DB: nechta thread, har biri bitta doimiy ulanish ushlab turadi
+DB_THREADS = int(os.getenv("DB_THREADS", "4"))
+DB_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA busy_timeout=5000;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA mmap_size=268435456;",   # 256 MB
+    "PRAGMA cache_size=-65536;",     # 64 MB
+)
+
+# Usta profil keshi (user_id -> qator)
+USTA_CACHE_SIZE = int(os.getenv("USTA_CACHE_SIZE", "10000"))
+USTA_CACHE_TTL = float(os.getenv("USTA_CACHE_TTL", "600"))
+
+# Telegram limitlari: umumiy ~30 xabar/s, bitta chatga ~1 xabar/s.
+# WORKERS > 1 da har worker SEND_RATE / WORKERS oladi (run_worker).
+SEND_RATE = float(os.getenv("SEND_RATE", "30"))
+SEND_CHAT_INTERVAL = float(os.getenv("SEND_CHAT_INTERVAL", "1.0"))
+SEND_RETRIES = int(os.getenv("SEND_RETRIES", "3"))
+
+# Foydalanuvchi bo'yicha anti-flood: handler sinfi -> "tezlik/sig'im" (token/sek, burst)
+def _rate_limit(env: str, default: str) -> Tuple[float, float]:
+    rate, burst = os.getenv(env, default).split("/")
+    return float(rate), float(burst)
+
+THROTTLE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "read": _rate_limit("THROTTLE_READ", "1/5"),
+    "write": _rate_limit("THROTTLE_WRITE", "0.5/4"),
+    "admin": _rate_limit("THROTTLE_ADMIN", "5/20"),
+    "default": _rate_limit("THROTTLE_DEFAULT", "2/10"),
+}
+THROTTLE_USERS = int(os.getenv("THROTTLE_USERS", "50000"))
+
+# FSM holatlari: xotirada faqat "issiq" qismi, qolgani DB da
+FSM_HOT_SIZE = int(os.getenv("FSM_HOT_SIZE", "10000"))
+FSM_TTL = float(os.getenv("FSM_TTL", str(3 * 24 * 3600)))
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1.0"))
+FSM_PURGE_INTERVAL = float(os.getenv("FSM_PURGE_INTERVAL", "600"))
+
+# Ishga tushirish rejimi: polling | webhook (python bot.py webhook ham bo'ladi)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", "8080")))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # bo'sh bo'lsa set_webhook qilinmaydi (lokal test)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))
+# polling: getUpdates xatosidan keyin 1s dan POLL_BACKOFF_MAX gacha eksponensial kutish
+POLL_BACKOFF = BackoffConfig(min_delay=1.0, max_delay=float(os.getenv("POLL_BACKOFF_MAX", "60")), factor=2.0, jitter=0.1)
+
+# Ko'p jarayonli rejim: WORKERS > 1 bo'lsa supervisor update larni user id bo'yicha
+# workerlarga taqsimlaydi. WORKER_INDEX/WORKER_COUNT worker ichida o'rnatiladi.
+WORKERS = int(os.getenv("WORKERS", "1"))
+WORKER_INDEX = 0
+WORKER_COUNT = 1
+
+# Update executor: bir foydalanuvchining update lari ketma-ket, turli foydalanuvchilarniki
+# parallel, lekin bir vaqtda UPDATE_CONCURRENCY tadan ko'p handler emas. Navbatda
+# UPDATE_BACKLOG ta (yoki bitta foydalanuvchida UPDATE_USER_BACKLOG ta) update bo'lsa
+# yangilari tashlanadi; UPDATE_MAX_AGE sekunddan ko'p kutgani ham (0 = cheksiz).
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "100"))
+UPDATE_BACKLOG = int(os.getenv("UPDATE_BACKLOG", "10000"))
+UPDATE_USER_BACKLOG = int(os.getenv("UPDATE_USER_BACKLOG", "10"))
+UPDATE_MAX_AGE = float(os.getenv("UPDATE_MAX_AGE", "60"))
+
+# Ro'yxatlar sahifasi (keyset pagination)
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "10"))
+
+# Yagona yozuvchi: bitta tranzaksiyaga nechtagacha yozuv yig'iladi
+DB_WRITE_BATCH = int(os.getenv("DB_WRITE_BATCH", "500"))
+
+# Arxiv: qabul qilingan / muddati o'tgan eski buyurtmalar oylik fayllarga ko'chiriladi
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", DB_PATH.parent / "archive"))
+ARCHIVE_AGE_DAYS = float(os.getenv("ARCHIVE_AGE_DAYS", "90"))  # 0 = o'chirilgan
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "500"))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "3600"))
+
+# Admin tarqatmasi (barcha faol ustalarga): bir bo'lakda nechta qabul qiluvchi,
+# progress xabari necha sekundda bir tahrirlanadi
+BROADCAST_BATCH = int(os.getenv("BROADCAST_BATCH", "100"))
+BROADCAST_EDIT_INTERVAL = float(os.getenv("BROADCAST_EDIT_INTERVAL", "3"))
+
+# /metrics (Prometheus). 0 - o'chirilgan
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Update trafigini yozib olish (bench/replay.py uchun). Bo'sh - o'chirilgan.
+# ID lar TRACE_SALT (yo'q bo'lsa token) bilan HMAC qilinadi, telefonlar almashtiriladi.
+TRACE_PATH = os.getenv("TRACE_PATH", "")
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", "5"))
+TRACE_SALT = os.getenv("TRACE_SALT", "")
+
+# Admin /profile: namuna olish oralig'i va eng uzun davomiylik (sekund)
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_MAX_SECONDS = 60
+
+# Buyurtma yetkazish (outbox): bir urinishda nechta, xatoda qancha kutish
+DELIVERY_BATCH = int(os.getenv("DELIVERY_BATCH", "100"))
+DELIVERY_MAX_ATTEMPTS = int(os.getenv("DELIVERY_MAX_ATTEMPTS", "5"))
+DELIVERY_RETRY_DELAY = float(os.getenv("DELIVERY_RETRY_DELAY", "30"))
+
+# Qabul qilinmagan buyurtmani keyingi ustalarga qayta yuborish (to'lqinlar)
+REDISPATCH_TIMEOUT = float(os.getenv("REDISPATCH_TIMEOUT", "600"))
+REDISPATCH_MAX_WAVES = int(os.getenv("REDISPATCH_MAX_WAVES", "3"))
+WAVE_SIZE = 10
+
+# Reyting: bugun qabul qilingan har bir buyurtma uchun jarima (yuklamani taqsimlash)
+MATCH_LOAD_PENALTY = float(os.getenv("MATCH_LOAD_PENALTY", "0.1"))
+
+# Qo'shni viloyatlar (text_key ko'rinishida): to'lqinda hudud kengaytiriladi
+REGION_NEIGHBOURS: Dict[str, Tuple[str, ...]] = {
+    "toshkent": ("sirdaryo", "namangan"),
+    "andijon": ("namangan", "fargona"),
+    "fargona": ("andijon", "namangan"),
+    "namangan": ("andijon", "fargona", "toshkent"),
+    "sirdaryo": ("toshkent", "jizzax"),
+    "jizzax": ("sirdaryo", "samarqand", "navoiy"),
+    "samarqand": ("jizzax", "navoiy", "qashqadaryo"),
+    "navoiy": ("samarqand", "jizzax", "buxoro", "qoraqalpogiston"),
+    "buxoro": ("navoiy", "qashqadaryo", "xorazm"),
+    "qashqadaryo": ("samarqand", "buxoro", "surxondaryo", "navoiy"),
+    "surxondaryo": ("qashqadaryo",),
+    "xorazm": ("buxoro", "qoraqalpogiston"),
+    "qoraqalpogiston": ("xorazm", "navoiy", "buxoro"),
+}
+# Viloyat nomlarining boshqa yozilishlari (normallashtirilgan, kirill -> lotindan keyin)
+REGION_ALIASES: Dict[str, str] = {
+    "andijan": "andijon", "fergana": "fargona", "ferghana": "fargona", "tashkent": "toshkent",
+    "samarkand": "samarqand", "bukhara": "buxoro", "buxara": "buxoro", "khorezm": "xorazm",
+    "xorezm": "xorazm", "navoi": "navoiy", "jizzakh": "jizzax", "djizak": "jizzax", "dzhizak": "jizzax",
+    "syrdarya": "sirdaryo", "sirdarya": "sirdaryo", "kashkadarya": "qashqadaryo",
+    "surkhandarya": "surxondaryo", "surxandarya": "surxondaryo", "karakalpakstan": "qoraqalpogiston",
+}
+REGION_STOPWORDS = {"tumani", "tuman", "shahri", "shahar", "sh", "viloyati", "viloyat", "rayon", "oblast", "oblasti"}
+
+# Kasblar taksonomiyasi (birinchi migratsiyada job_categories/job_synonyms ga yoziladi).
+# id lar o'zgarmaydi. Sinonimlar normallashtiriladi, kirillchasi ham shu yerda.
+JOB_CATEGORIES: Tuple[Tuple[int, str, Tuple[str, ...]], ...] = (
+    (1, "Elektrik", ("elektrik", "elektr", "elektromontyor", "svet", "электрик", "электромонтёр", "свет")),
+    (2, "Santexnik", ("santexnik", "santehnik", "suvchi", "vodoprovod", "kanalizatsiya", "сантехник", "водопровод")),
+    (3, "Payvandchi", ("payvandchi", "payvand", "svarshik", "svarka", "сварщик", "сварка")),
+    (4, "Duradgor", ("duradgor", "stolyar", "plotnik", "mebel", "eshik", "deraza", "столяр", "плотник", "мебель")),
+    (5, "Kafelchi", ("kafelchi", "kafel", "plitka", "plitochnik", "кафель", "плитка", "плиточник")),
+    (6, "Bo‘yoqchi", ("bo'yoqchi", "bo'yoq", "malyar", "suvoqchi", "suvoq", "shpaklyovka", "маляр", "штукатур")),
+    (7, "Konditsioner ustasi", ("konditsioner", "kondisioner", "sovutgich", "holodilnik", "кондиционер", "холодильник")),
+    (8, "Maishiy texnika ustasi", ("maishiy texnika", "texnika", "kir yuvish mashinasi", "televizor",
+                                   "бытовая техника", "стиральная машина")),
+    (9, "Gipsokarton ustasi", ("gipsokarton", "gipskarton", "potolok", "гипсокартон", "потолок")),
+    (10, "Tom yopuvchi", ("tom yopuvchi", "tomchi", "krovlya", "tunukasoz", "кровля", "кровельщик")),
+    (11, "Quruvchi", ("quruvchi", "qurilish", "g'isht", "g'ishtchi", "строитель", "каменщик")),
+)
+JOB_STOPWORDS = {"usta", "ustasi", "ustasiman", "ustaman", "kerak", "master", "ish", "ishi", "xizmati"}
+
+TG_TEXT_LIMIT = 4096
 
 PHONE_RE = re.compile(r"^\+?\d[\d\s\-]{7,}$")
 
@@ -48,32 +235,353 @@ BTN_CANCEL = "❌ Bekor qilish"
 BTN_ADMIN = "🛡 Admin panel"
 BTN_ADMIN_USTALAR = "📋 Admin: Ustalar"
 BTN_ADMIN_BUYURTMALAR = "🧾 Admin: Buyurtmalar"
+BTN_ADMIN_STATS = "📊 Admin: Statistika"
+BTN_ADMIN_BROADCAST = "📣 Admin: Ustalarga xabar"
 BTN_ADMIN_BLOCK = "🚫 Admin: Bloklash (ID)"
 BTN_ADMIN_UNBLOCK = "✅ Admin: Aktivlash (ID)"
 BTN_ADMIN_BACK = "⬅️ Admin: Orqaga"
 
+log = logging.getLogger("ustaxizmati")
+
 # ----------------- BOT INIT -----------------
 bot = Bot(token=TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+
+# ----------------- METRICS -----------------
+# Prometheus text formatidagi oddiy metrikalar (tashqi kutubxonasiz).
+# observe/inc DB threadlaridan ham chaqiriladi, shuning uchun lock bilan.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS: List[Any] = []
+
+def _labels(names: Tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v).replace(chr(34), chr(39))}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+class MetricCounter:
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = ()):
+        self.name, self.doc, self.labels = name, doc, labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    def inc(self, *labelvalues: Any, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        for values, v in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, values)} {v}")
+        return lines
+
+class MetricHistogram:
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.doc, self.labels, self.buckets = name, doc, labels, buckets
+        # labelvalues -> [bucket hisoblari..., +Inf, sum]
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    def observe(self, value: float, *labelvalues: Any) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            item = self._values.get(labelvalues)
+            if item is None:
+                item = self._values[labelvalues] = [0] * (len(self.buckets) + 2)
+            item[idx] += 1
+            item[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        for values, item in sorted(self._values.items()):
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), item):
+                total += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(names, values + (le,))} {total}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {item[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {total}")
+        return lines
+
+class MetricGauge:
+    # qiymat render vaqtida funksiyadan olinadi (kesh hajmi va h.k.)
+    def __init__(self, name: str, doc: str, fn: Callable[[], float], kind: str = "gauge"):
+        self.name, self.doc, self.fn, self.kind = name, doc, fn, kind
+        METRICS.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}", f"{self.name} {self.fn()}"]
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+UPDATE_LATENCY = MetricHistogram("bot_update_seconds", "Update processing time by update type", ("type",))
+HANDLER_LATENCY = MetricHistogram("bot_handler_seconds", "Handler execution time", ("handler",))
+HANDLER_ERRORS = MetricCounter("bot_handler_errors_total", "Handler exceptions", ("handler", "error"))
+DB_LATENCY = MetricHistogram("bot_db_query_seconds", "DB helper execution time", ("query",))
+DB_ROWS = MetricCounter("bot_db_rows_total", "Rows returned or affected by DB helpers", ("query",))
+TG_REQUESTS = MetricCounter("bot_telegram_requests_total", "Outbound Bot API calls", ("method", "result"))
+TG_LATENCY = MetricHistogram("bot_telegram_request_seconds", "Outbound Bot API call time", ("method",))
+
+def _row_count(result: Any) -> int:
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, bool):
+        return int(result)
+    return 0 if result is None else 1
+
+def timed_db_call(fn: Callable[..., Any], *args: Any) -> Any:
+    started = time.perf_counter()
+    result = fn(*args)
+    DB_LATENCY.observe(time.perf_counter() - started, fn.__name__)
+    DB_ROWS.inc(fn.__name__, amount=_row_count(result))
+    return result
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            UPDATE_LATENCY.observe(time.perf_counter() - started, event.event_type)
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        name = data["handler"].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, name)
+
+class OutboundMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            result = await make_request(bot, method)
+        except Exception as e:
+            TG_REQUESTS.inc(name, type(e).__name__)
+            raise
+        finally:
+            TG_LATENCY.observe(time.perf_counter() - started, name)
+        TG_REQUESTS.inc(name, "ok")
+        return result
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+async def start_metrics_server(port: int = METRICS_PORT) -> Optional[web.AppRunner]:
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, port).start()
+    log.info("metrics: http://%s:%s/metrics", METRICS_HOST, port)
+    return runner
+
+# ----------------- TEXT NORMALIZATION -----------------
+# Qidiruv uchun: kichik harf, apostrof turlari bitta, kirill -> lotin
+APOSTROPHES = str.maketrans({c: "'" for c in "‘’ʼʻ`´"})
+CYRILLIC_TO_LATIN = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "yo",
+    "ж": "j", "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m",
+    "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "x", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sh", "ъ": "'",
+    "ь": "", "ы": "i", "э": "e", "ю": "yu", "я": "ya", "ў": "o'", "қ": "q",
+    "ғ": "g'", "ҳ": "h",
+}
+CYRILLIC_TABLE = str.maketrans(CYRILLIC_TO_LATIN)
+WORD_RE = re.compile(r"\w+")
+
+def normalize_text(text: str) -> str:
+    return (text or "").casefold().translate(APOSTROPHES).translate(CYRILLIC_TABLE)
+
+def text_key(text: str) -> str:
+    # taksonomiya/hudud lug'ati kaliti: apostrof olib tashlanadi ("farg'ona" = "fargona"),
+    # so'zlar bitta bo'sh joy bilan
+    return " ".join(WORD_RE.findall(normalize_text(text).replace("'", "")))
+
+# ----------------- TAXONOMY -----------------
+class JobTaxonomy:
+    # job_synonyms dan xotiradagi indeks (startupda yuklanadi). Erkin matn ->
+    # kategoriya id lar: avval 3/2/1 so'zli aniq sinonim, keyin qo'shimchali so'z
+    # ("elektrikman", "santexnikka" - sinonim so'z boshida), oxirida xato yozuv (difflib).
+    def __init__(self):
+        self.names: Dict[int, str] = {}
+        self.keys: Dict[str, int] = {}
+        self.keyboard: Optional[InlineKeyboardMarkup] = None
+        self._words: List[str] = []
+
+    def load(self, conn: sqlite3.Connection) -> None:
+        self.names = {r["id"]: r["name"] for r in conn.execute("SELECT id, name FROM job_categories ORDER BY id;")}
+        self.keys = {r["key"]: r["category_id"] for r in conn.execute("SELECT key, category_id FROM job_synonyms;")}
+        self._words = sorted((k for k in self.keys if " " not in k), key=len, reverse=True)
+        buttons = [InlineKeyboardButton(text=name, callback_data=f"job:{cid}") for cid, name in self.names.items()]
+        self.keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons[i:i + 2] for i in range(0, len(buttons), 2)])
+
+    def _word(self, word: str) -> Optional[int]:
+        if word in self.keys:
+            return self.keys[word]
+        for key in self._words:
+            if len(key) >= 4 and word.startswith(key):
+                return self.keys[key]
+        close = difflib.get_close_matches(word, self._words, n=1, cutoff=0.8)
+        return self.keys[close[0]] if close else None
+
+    def resolve(self, text: str) -> List[int]:
+        words = text_key(text).split()
+        found: List[int] = []
+        i = 0
+        while i < len(words):
+            for n in (3, 2):
+                cid = self.keys.get(" ".join(words[i:i + n])) if i + n <= len(words) else None
+                if cid is not None:
+                    found.append(cid)
+                    i += n
+                    break
+            else:
+                if words[i] not in JOB_STOPWORDS and len(words[i]) >= 3:
+                    cid = self._word(words[i])
+                    if cid is not None:
+                        found.append(cid)
+                i += 1
+        return list(dict.fromkeys(found))
+
+    def label(self, category_ids: List[int]) -> str:
+        return ", ".join(self.names[c] for c in category_ids)
+
+job_taxonomy = JobTaxonomy()
+
+def seed_taxonomy_tx(conn: sqlite3.Connection) -> None:
+    conn.executemany("INSERT OR IGNORE INTO job_categories(id, name) VALUES (?, ?);",
+                     [(cid, name) for cid, name, _ in JOB_CATEGORIES])
+    conn.executemany("INSERT OR IGNORE INTO job_synonyms(key, category_id) VALUES (?, ?);",
+                     [(text_key(s), cid) for cid, name, synonyms in JOB_CATEGORIES for s in (name, *synonyms)])
+    conn.executemany("INSERT OR IGNORE INTO regions(key, name) VALUES (?, ?);",
+                     [(key, key.capitalize()) for key in REGION_NEIGHBOURS])
+
+def region_parts(text: str) -> Tuple[Optional[str], Optional[str]]:
+    # "Andijon, Asaka tumani" -> ("andijon", "asaka"); "Asaka" -> (None, "asaka")
+    viloyat = district = None
+    for part in re.split(r"[,;/]+", text or ""):
+        words = [REGION_ALIASES.get(w, w) for w in text_key(part).split() if w not in REGION_STOPWORDS]
+        if not words:
+            continue
+        if viloyat is None and words[0] in REGION_NEIGHBOURS:
+            viloyat, words = words[0], words[1:]
+        if words:
+            district = " ".join(words)
+    return viloyat, district
+
+# Hudud matni -> regions.id. create=True (faqat usta ro'yxatdan o'tishi, yozuvchi
+# tranzaksiyasida): notanish tuman qo'shiladi, viloyati ma'lum bo'lsa parent_id bilan.
+# Aks holda (buyurtmalar, o'qish) notanish tuman o'rniga viloyat qaytadi.
+def lookup_region(conn: sqlite3.Connection, text: str, create: bool = False) -> Optional[int]:
+    viloyat, district = region_parts(text)
+    vil = conn.execute("SELECT id FROM regions WHERE key=?;", (viloyat,)).fetchone() if viloyat else None
+    vil_id = vil["id"] if vil else None
+    if district is None:
+        return vil_id
+    row = conn.execute("SELECT id, parent_id FROM regions WHERE key=?;", (district,)).fetchone()
+    if row is not None:
+        if create and row["parent_id"] is None and vil_id is not None and row["id"] != vil_id:
+            conn.execute("UPDATE regions SET parent_id=? WHERE id=?;", (vil_id, row["id"]))
+        return row["id"]
+    if not create:
+        return vil_id
+    return conn.execute("INSERT INTO regions(key, name, parent_id) VALUES (?, ?, ?) RETURNING id;",
+                        (district, district.capitalize(), vil_id)).fetchone()["id"]
+
+# Buyurtma hududi uchun ustalar hududlari: o'zi, tumanlari va viloyati
+def region_scope(conn: sqlite3.Connection, region_id: Optional[int]) -> List[int]:
+    if region_id is None:
+        return []
+    return [r[0] for r in conn.execute("""
+        SELECT id FROM regions WHERE id=?1 OR parent_id=?1
+        UNION SELECT parent_id FROM regions WHERE id=?1 AND parent_id IS NOT NULL;
+    """, (region_id,))]
+
+# Qo'shni viloyatlar va ularning tumanlari
+def neighbour_scope(conn: sqlite3.Connection, region_id: Optional[int]) -> List[int]:
+    if region_id is None:
+        return []
+    row = conn.execute("""
+        SELECT COALESCE(p.key, r.key) AS key FROM regions r LEFT JOIN regions p ON p.id = r.parent_id
+        WHERE r.id=?;
+    """, (region_id,)).fetchone()
+    near = REGION_NEIGHBOURS.get(row["key"], ()) if row else ()
+    if not near:
+        return []
+    marks = ",".join("?" * len(near))
+    return [r[0] for r in conn.execute(f"""
+        SELECT id FROM regions WHERE key IN ({marks})
+        UNION SELECT id FROM regions WHERE parent_id IN (SELECT id FROM regions WHERE key IN ({marks}));
+    """, near * 2)]
+
+# ustalar -> usta_categories (kasb x hudud, is_active nusxasi bilan)
+def link_usta_tx(conn: sqlite3.Connection, usta: sqlite3.Row) -> int:
+    conn.execute("DELETE FROM usta_categories WHERE usta_id=?;", (usta["user_id"],))
+    region_id = lookup_region(conn, usta["region"], create=True)
+    categories = job_taxonomy.resolve(usta["job"])
+    conn.executemany("""
+        INSERT INTO usta_categories(usta_id, category_id, region_id, is_active) VALUES (?, ?, ?, ?);
+    """, [(usta["user_id"], cid, region_id, usta["is_active"]) for cid in categories])
+    return len(categories)
 
 # ----------------- DB HELPERS -----------------
+# Har bir DB thread o'zining doimiy ulanishini saqlaydi: connect/close,
+# schema parse va page cache har chaqiruvda qayta qilinmaydi.
+db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+_db_local = threading.local()
+_db_conns: List[sqlite3.Connection] = []
+_db_conns_lock = threading.Lock()
+
 def db_connect() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, cached_statements=256, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in DB_PRAGMAS:
+            conn.execute(pragma)
+        _db_local.conn = conn
+        with _db_conns_lock:
+            _db_conns.append(conn)
     return conn
 
-def _try_exec(cur: sqlite3.Cursor, sql: str):
-    try:
-        cur.execute(sql)
-    except Exception:
-        pass
-
-def init_db_sync() -> None:
-    conn = db_connect()
-    cur = conn.cursor()
-
+async def run_db(fn: Callable[..., Any], *args: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, timed_db_call, fn, *args)
+
+def close_db() -> None:
+    db_executor.shutdown(wait=True)
+    with _db_conns_lock:
+        for conn in _db_conns:
+            conn.close()
+        _db_conns.clear()
+
+# ----------------- MIGRATIONS -----------------
+# Sxema versiyasi PRAGMA user_version da. Har bir qadam bir marta,
+# o'z tranzaksiyasida bajariladi. Yangi qadam faqat ro'yxat oxiriga qo'shiladi.
+def _add_column(conn: sqlite3.Connection, table: str, column: str, decl: str) -> None:
+    cols = {r["name"] for r in conn.execute(f"PRAGMA table_info({table});")}
+    if column not in cols:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl};")
+
+def _migration_base_tables(conn: sqlite3.Connection) -> None:
     # ustalar: status + is_active qo'shildi
-    cur.execute("""
+    conn.execute("""
     CREATE TABLE IF NOT EXISTS ustalar (
         user_id INTEGER PRIMARY KEY,
         name TEXT NOT NULL,
@@ -86,13 +594,12 @@ def init_db_sync() -> None:
         updated_at TEXT DEFAULT (datetime('now'))
     );
     """)
-
     # eski db bo'lsa, ustiga column qo'shib qo'yamiz (agar yo'q bo'lsa)
-    _try_exec(cur, "ALTER TABLE ustalar ADD COLUMN status TEXT DEFAULT '🟢 Bo‘shman';")
-    _try_exec(cur, "ALTER TABLE ustalar ADD COLUMN is_active INTEGER DEFAULT 1;")
+    _add_column(conn, "ustalar", "status", "TEXT DEFAULT '🟢 Bo‘shman'")
+    _add_column(conn, "ustalar", "is_active", "INTEGER DEFAULT 1")
 
     # ✅ buyurtmalar: qabul qilish uchun status/accepted_by/accepted_at qo‘shildi
-    cur.execute("""
+    conn.execute("""
     CREATE TABLE IF NOT EXISTS buyurtmalar (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER NOT NULL,
@@ -106,22 +613,434 @@ def init_db_sync() -> None:
         created_at TEXT DEFAULT (datetime('now'))
     );
     """)
+    _add_column(conn, "buyurtmalar", "status", "TEXT DEFAULT 'new'")
+    _add_column(conn, "buyurtmalar", "accepted_by", "INTEGER")
+    _add_column(conn, "buyurtmalar", "accepted_at", "TEXT")
+
+def _migration_fts_retired(conn: sqlite3.Connection) -> None:
+    # 2-versiya ustalar_fts (FTS5 soyasi) ni yaratardi; moslashtirish taksonomiyaga
+    # (11-versiya) o'tdi, u eski bazalarda jadvalni o'chiradi. Yangi bazada yaratib,
+    # to'ldirib, keyin o'chirish befoyda - raqamlash saqlanishi uchun bo'sh qadam.
+    pass
+
+def _migration_fsm_states(conn: sqlite3.Connection) -> None:
+    # FSM holatlari (SQLiteStorage)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS fsm_states (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT NOT NULL DEFAULT '{}',
+        updated_at REAL NOT NULL
+    );
+    """)
+
+def _migration_indexes(conn: sqlite3.Connection) -> None:
+    # keyset pagination: (updated_at, user_id) bo'yicha
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ustalar_updated ON ustalar(updated_at, user_id);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ustalar_active ON ustalar(is_active, updated_at);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_buyurtmalar_status ON buyurtmalar(status);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_buyurtmalar_user ON buyurtmalar(user_id);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_buyurtmalar_accepted_by ON buyurtmalar(accepted_by);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states(updated_at);")
+
+def _migration_order_deliveries(conn: sqlite3.Connection) -> None:
+    # 📬 outbox: buyurtma kimga yuborilishi kerak / yuborildi (message_id bilan)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS order_deliveries (
+        id INTEGER PRIMARY KEY,
+        order_id INTEGER NOT NULL,
+        usta_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        message_id INTEGER,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_at REAL NOT NULL DEFAULT 0,
+        error TEXT,
+        created_at TEXT DEFAULT (datetime('now')),
+        sent_at TEXT,
+        UNIQUE(order_id, usta_id)
+    );
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_pending ON order_deliveries(next_at) WHERE status='pending';")
+
+def _migration_order_waves(conn: sqlite3.Connection) -> None:
+    # wave: nechinchi to'lqin yuborilgan; next_wave_at: keyingisi qachon (NULL = yo'q)
+    _add_column(conn, "buyurtmalar", "wave", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(conn, "buyurtmalar", "next_wave_at", "REAL")
+
+def _migration_archive_index(conn: sqlite3.Connection) -> None:
+    # 🗄 qaysi oy arxiv faylida qaysi id oralig'i bor
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS archive_index (
+        month TEXT PRIMARY KEY,
+        min_id INTEGER NOT NULL,
+        max_id INTEGER NOT NULL,
+        rows INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+
+def _migration_usta_stats(conn: sqlite3.Connection) -> None:
+    # 📊 moslashtirish reytingi uchun oldindan hisoblangan ko'rsatkichlar (inkremental yangilanadi)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS usta_stats (
+        user_id INTEGER PRIMARY KEY,
+        offers INTEGER NOT NULL DEFAULT 0,
+        accepts INTEGER NOT NULL DEFAULT 0,
+        responses INTEGER NOT NULL DEFAULT 0,
+        response_secs REAL NOT NULL DEFAULT 0,
+        day TEXT,
+        day_accepts INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    conn.execute("""
+    INSERT OR REPLACE INTO usta_stats(user_id, offers, accepts, responses, response_secs, day, day_accepts)
+    SELECT u.user_id,
+           (SELECT count(*) FROM order_deliveries d WHERE d.usta_id=u.user_id AND d.status='sent'),
+           (SELECT count(*) FROM buyurtmalar b WHERE b.accepted_by=u.user_id),
+           (SELECT count(*) FROM buyurtmalar b JOIN order_deliveries d ON d.order_id=b.id AND d.usta_id=b.accepted_by
+            WHERE b.accepted_by=u.user_id AND d.sent_at IS NOT NULL),
+           (SELECT COALESCE(sum((julianday(b.accepted_at) - julianday(d.sent_at)) * 86400), 0)
+            FROM buyurtmalar b JOIN order_deliveries d ON d.order_id=b.id AND d.usta_id=b.accepted_by
+            WHERE b.accepted_by=u.user_id AND d.sent_at IS NOT NULL),
+           date('now'),
+           (SELECT count(*) FROM buyurtmalar b WHERE b.accepted_by=u.user_id AND date(b.accepted_at)=date('now'))
+    FROM ustalar u;
+    """)
 
-    # eski db bo'lsa ham qo‘shib qo‘yamiz
-    _try_exec(cur, "ALTER TABLE buyurtmalar ADD COLUMN status TEXT DEFAULT 'new';")
-    _try_exec(cur, "ALTER TABLE buyurtmalar ADD COLUMN accepted_by INTEGER;")
-    _try_exec(cur, "ALTER TABLE buyurtmalar ADD COLUMN accepted_at TEXT;")
+def _migration_rollups_retired(conn: sqlite3.Connection) -> None:
+    # 9-versiya erkin matn kalitli yig'ma jadvallarni yaratardi; ular
+    # taksonomiya id lari bo'yicha 12-versiyada qayta quriladi. Raqamlash uchun bo'sh qadam.
+    pass
 
-    conn.commit()
-    conn.close()
+def _migration_broadcasts(conn: sqlite3.Connection) -> None:
+    # 📣 admin tarqatmasi: cursor - oxirgi yuborilgan usta user_id (keyset), restartda davom etadi
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS broadcasts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        admin_id INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'running',
+        cursor INTEGER NOT NULL DEFAULT 0,
+        total INTEGER NOT NULL DEFAULT 0,
+        sent INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        chat_id INTEGER,
+        message_id INTEGER,
+        created_at TEXT DEFAULT (datetime('now')),
+        finished_at TEXT
+    );
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts(status);")
+
+def _migration_taxonomy(conn: sqlite3.Connection) -> None:
+    # 🗂 kasb/hudud lug'atlari; moslashtirish FTS o'rniga butun son join
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS job_categories (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL
+    );
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS job_synonyms (
+        key TEXT PRIMARY KEY,
+        category_id INTEGER NOT NULL REFERENCES job_categories(id)
+    ) WITHOUT ROWID;
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS regions (
+        id INTEGER PRIMARY KEY,
+        key TEXT NOT NULL UNIQUE,
+        name TEXT NOT NULL,
+        parent_id INTEGER REFERENCES regions(id)
+    );
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_regions_parent ON regions(parent_id);")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS usta_categories (
+        usta_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        region_id INTEGER,
+        is_active INTEGER NOT NULL DEFAULT 1,
+        PRIMARY KEY (usta_id, category_id)
+    ) WITHOUT ROWID;
+    """)
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_usta_categories_match
+    ON usta_categories(category_id, region_id, is_active);
+    """)
+    _add_column(conn, "buyurtmalar", "category_id", "INTEGER")
+    _add_column(conn, "buyurtmalar", "region_id", "INTEGER")
+    seed_taxonomy_tx(conn)
+    job_taxonomy.load(conn)
+
+    # eski erkin matnli yozuvlar: ustalar bittalab, buyurtmalar (ish_turi, hudud) juftligi bo'yicha
+    unmapped = sum(not link_usta_tx(conn, u) for u in conn.execute("SELECT * FROM ustalar;").fetchall())
+    conn.execute("CREATE TEMP TABLE order_map (ish_turi TEXT, region TEXT, category_id INTEGER, region_id INTEGER,"
+                 " PRIMARY KEY (ish_turi, region));")
+    pairs = conn.execute("SELECT DISTINCT ish_turi, region FROM buyurtmalar;").fetchall()
+    conn.executemany("INSERT INTO order_map VALUES (?, ?, ?, ?);", [
+        (p["ish_turi"], p["region"], next(iter(job_taxonomy.resolve(p["ish_turi"])), None),
+         lookup_region(conn, p["region"]))
+        for p in pairs
+    ])
+    conn.execute("""
+        UPDATE buyurtmalar SET (category_id, region_id) = (
+            SELECT m.category_id, m.region_id FROM order_map m
+            WHERE m.ish_turi = buyurtmalar.ish_turi AND m.region = buyurtmalar.region);
+    """)
+    conn.execute("DROP TABLE order_map;")
+    conn.execute("DROP TABLE IF EXISTS ustalar_fts;")
+    if unmapped:
+        log.warning("taxonomy: %d masters have a job that matches no category", unmapped)
+
+def _migration_rollups_by_category(conn: sqlite3.Connection) -> None:
+    # 📊 admin statistikasi uchun yig'ma jadvallar, taksonomiya id lari bo'yicha (0 - aniqlanmagan):
+    # order_rollups - kun x kasb x hudud; usta_rollups - kun oxiridagi faol ustalar (kasb x hudud),
+    # faqat o'zgarish bo'lgan kunlar uchun qatorlar
+    conn.execute("DROP TABLE IF EXISTS order_rollups;")
+    conn.execute("DROP TABLE IF EXISTS usta_rollups;")
+    conn.execute("""
+    CREATE TABLE order_rollups (
+        day TEXT NOT NULL,
+        category_id INTEGER NOT NULL,
+        region_id INTEGER NOT NULL,
+        created INTEGER NOT NULL DEFAULT 0,
+        accepted INTEGER NOT NULL DEFAULT 0,
+        accept_secs REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, category_id, region_id)
+    ) WITHOUT ROWID;
+    """)
+    conn.execute("""
+    CREATE TABLE usta_rollups (
+        day TEXT NOT NULL,
+        category_id INTEGER NOT NULL,
+        region_id INTEGER NOT NULL,
+        active INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, category_id, region_id)
+    ) WITHOUT ROWID;
+    """)
+    job_taxonomy.load(conn)
+    # /rebuild_stats bilan bir xil manba: hot jadval + arxiv fayllari
+    replace_rollups_tx(conn, *collect_rollups_from(conn))
+
+def _migration_orders_created_index(conn: sqlite3.Connection) -> None:
+    # arxivlash chegarasi: yoshi yetgan eng so'nggi buyurtma bitta indeks qidiruvi bilan
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_buyurtmalar_created ON buyurtmalar(created_at);")
+
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _migration_base_tables,
+    _migration_fts_retired,
+    _migration_fsm_states,
+    _migration_indexes,
+    _migration_order_deliveries,
+    _migration_order_waves,
+    _migration_usta_stats,
+    _migration_archive_index,
+    _migration_rollups_retired,
+    _migration_broadcasts,
+    _migration_taxonomy,
+    _migration_rollups_by_category,
+    _migration_orders_created_index,
+]
+
+def init_db_sync() -> int:
+    conn = db_connect()
+    version = conn.execute("PRAGMA user_version;").fetchone()[0]
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        with conn:
+            conn.execute("BEGIN;")
+            step(conn)
+            conn.execute(f"PRAGMA user_version={number};")
+        log.info("db: migration %d (%s) applied", number, step.__name__)
+    job_taxonomy.load(conn)
+    return len(MIGRATIONS)
 
 async def init_db() -> None:
-    await asyncio.to_thread(init_db_sync)
-
-def upsert_usta_sync(user_id: int, name: str, phone: str, job: str, region: str) -> None:
+    started = time.perf_counter()
+    version = await run_db(init_db_sync)
+    log.info("db: schema v%d ready in %.1f ms", version, (time.perf_counter() - started) * 1000)
+
+# ----------------- DB WRITER -----------------
+# Barcha yozuvlar bitta navbat orqali: yozuvchi navbatdagi hamma o'zgarishni
+# bitta tranzaksiyada commit qiladi (group commit, bitta fsync). Har bir
+# yozuv o'z SAVEPOINT ida: bittasi xato bersa, qolganlari commit bo'ladi.
+# Chaqiruvchining future i faqat batch commit bo'lgandan keyin yakunlanadi.
+def write_batch_sync(ops: List[Tuple[Callable[..., Any], tuple]]) -> List[Tuple[bool, Any]]:
     conn = db_connect()
-    cur = conn.cursor()
-    cur.execute("""
+    results: List[Tuple[bool, Any]] = []
+    conn.execute("BEGIN IMMEDIATE;")
+    try:
+        for fn, args in ops:
+            conn.execute("SAVEPOINT w;")
+            try:
+                results.append((True, timed_db_call(fn, conn, *args)))
+                conn.execute("RELEASE w;")
+            except Exception as e:
+                conn.execute("ROLLBACK TO w;")
+                conn.execute("RELEASE w;")
+                results.append((False, e))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return results
+
+def write_sync(fn: Callable[..., Any], *args: Any) -> Any:
+    ok, res = write_batch_sync([(fn, args)])[0]
+    if not ok:
+        raise res
+    return res
+
+class DBWriter:
+    def __init__(self, max_batch: int = DB_WRITE_BATCH):
+        self.max_batch = max_batch
+        self._queue: List[tuple] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.writes = 0
+
+    async def submit(self, fn: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        fut = loop.create_future()
+        self._queue.append((fn, args, fut))
+        self._wakeup.set()
+        return await fut
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._queue:
+                batch = self._queue[:self.max_batch]
+                del self._queue[:self.max_batch]
+                try:
+                    results = await run_db(write_batch_sync, [(fn, args) for fn, args, _ in batch])
+                except Exception as e:
+                    results = [(False, e)] * len(batch)
+                self.batches += 1
+                self.writes += len(batch)
+                for (_, _, fut), (ok, res) in zip(batch, results):
+                    if fut.done():
+                        continue
+                    if ok:
+                        fut.set_result(res)
+                    else:
+                        fut.set_exception(res)
+
+db_writer = DBWriter()
+
+async def db_write(fn: Callable[..., Any], *args: Any) -> Any:
+    return await db_writer.submit(fn, *args)
+
+# ----------------- USTA CACHE -----------------
+_MISS = object()
+
+class ClusterLink:
+    # Worker rejimida boshqa workerlarga xabar (supervisor orqali): kesh invalidatsiyasi,
+    # outbox uyg'otish. Bitta jarayonda conn yo'q - hech narsa qilmaydi.
+    def __init__(self):
+        self.conn = None
+
+    def publish(self, *msg: Any) -> None:
+        if self.conn is not None:
+            try:
+                self.conn.send(msg)
+            except (BrokenPipeError, OSError):
+                log.warning("cluster: supervisor link lost, dropped %r", msg[0])
+
+cluster = ClusterLink()
+
+class UstaCache:
+    # LRU + TTL. None ham keshlanadi (ro'yxatdan o'tmagan user).
+    # generation: har yozuvda oshadi, eski o'qish yangi yozuvni bosib ketmasin.
+    # Yozuv/invalidatsiya boshqa workerlarga ham e'lon qilinadi (publish=True).
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[int, tuple]" = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: int) -> Any:
+        item = self._data.get(user_id)
+        if item is None or item[0] < time.monotonic():
+            self.misses += 1
+            return _MISS
+        self._data.move_to_end(user_id)
+        self.hits += 1
+        return item[1]
+
+    def put(self, user_id: int, row: Optional[sqlite3.Row], generation: Optional[int] = None) -> None:
+        if generation is not None and generation != self.generation:
+            return
+        self._data[user_id] = (time.monotonic() + self.ttl, row)
+        self._data.move_to_end(user_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def write(self, user_id: int, row: Optional[sqlite3.Row]) -> None:
+        self.generation += 1
+        self.put(user_id, row)
+        cluster.publish("invalidate", user_id)
+
+    def invalidate(self, user_id: int, publish: bool = True) -> None:
+        self.generation += 1
+        self._data.pop(user_id, None)
+        if publish:
+            cluster.publish("invalidate", user_id)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+usta_cache = UstaCache(USTA_CACHE_SIZE, USTA_CACHE_TTL)
+
+# *_tx: ochiq tranzaksiya ichida ishlaydi (commit qilmaydi), DBWriter orqali chaqiriladi.
+# *_sync: o'sha amal alohida tranzaksiyada (skriptlar/benchmark uchun).
+# usta yig'ma kaliti: asosiy (birinchi) kasbi - buyurtmalar kabi - va hududi; 0 - aniqlanmagan
+def usta_rollup_key(conn: sqlite3.Connection, usta: sqlite3.Row) -> Tuple[int, int]:
+    return next(iter(job_taxonomy.resolve(usta["job"])), 0), lookup_region(conn, usta["region"]) or 0
+
+# usta_rollups: eski holat (-1) va yangi holat (+1), faqat faol ustalar sanaladi. Kunning
+# birinchi o'zgarishida oxirgi kun holati bugunga ko'chiriladi (kun oxiridagi snapshot).
+def track_active_tx(conn: sqlite3.Connection, old: Optional[sqlite3.Row], new: Optional[sqlite3.Row]) -> None:
+    fields = ("job", "region", "is_active")
+    if old is not None and new is not None and all(old[f] == new[f] for f in fields):
+        return
+    deltas: Dict[Tuple[int, int], int] = {}
+    for r, delta in ((old, -1), (new, 1)):
+        if r is not None and r["is_active"]:
+            key = usta_rollup_key(conn, r)
+            deltas[key] = deltas.get(key, 0) + delta
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    conn.execute("""
+        INSERT INTO usta_rollups(day, category_id, region_id, active)
+        SELECT date('now'), category_id, region_id, active FROM usta_rollups
+        WHERE day = (SELECT max(day) FROM usta_rollups) AND day < date('now') AND active != 0;
+    """)
+    conn.executemany("""
+        INSERT INTO usta_rollups(day, category_id, region_id, active) VALUES (date('now'), ?, ?, ?)
+        ON CONFLICT(day, category_id, region_id) DO UPDATE SET active = active + excluded.active;
+    """, [(cid, rid, delta) for (cid, rid), delta in deltas.items()])
+
+def upsert_usta_tx(conn: sqlite3.Connection, user_id: int, name: str, phone: str, job: str, region: str) -> sqlite3.Row:
+    old = conn.execute("SELECT region, job, is_active FROM ustalar WHERE user_id=?;", (user_id,)).fetchone()
+    row = conn.execute("""
     INSERT INTO ustalar(user_id, name, phone, job, region, updated_at)
     VALUES (?, ?, ?, ?, ?, datetime('now'))
     ON CONFLICT(user_id) DO UPDATE SET
@@ -129,138 +1048,911 @@ def upsert_usta_sync(user_id: int, name: str, phone: str, job: str, region: str)
         phone=excluded.phone,
         job=excluded.job,
         region=excluded.region,
-        updated_at=datetime('now');
-    """, (user_id, name, phone, job, region))
-    conn.commit()
-    conn.close()
+        updated_at=datetime('now')
+    RETURNING *;
+    """, (user_id, name, phone, job, region)).fetchone()
+    link_usta_tx(conn, row)
+    track_active_tx(conn, old, row)
+    return row
+
+def upsert_usta_sync(user_id: int, name: str, phone: str, job: str, region: str) -> sqlite3.Row:
+    return write_sync(upsert_usta_tx, user_id, name, phone, job, region)
 
 async def upsert_usta(user_id: int, name: str, phone: str, job: str, region: str) -> None:
-    await asyncio.to_thread(upsert_usta_sync, user_id, name, phone, job, region)
+    row = await db_write(upsert_usta_tx, user_id, name, phone, job, region)
+    usta_cache.write(user_id, row)
 
 def get_usta_sync(user_id: int) -> Optional[sqlite3.Row]:
     conn = db_connect()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM ustalar WHERE user_id=?;", (user_id,))
-    row = cur.fetchone()
-    conn.close()
-    return row
+    return conn.execute("SELECT * FROM ustalar WHERE user_id=?;", (user_id,)).fetchone()
 
 async def get_usta(user_id: int) -> Optional[sqlite3.Row]:
-    return await asyncio.to_thread(get_usta_sync, user_id)
+    row = usta_cache.get(user_id)
+    if row is not _MISS:
+        return row
+    generation = usta_cache.generation
+    row = await run_db(get_usta_sync, user_id)
+    usta_cache.put(user_id, row, generation)
+    return row
 
-def set_usta_status_sync(user_id: int, status: str) -> None:
-    conn = db_connect()
-    cur = conn.cursor()
-    cur.execute("UPDATE ustalar SET status=?, updated_at=datetime('now') WHERE user_id=?;", (status, user_id))
-    conn.commit()
-    conn.close()
+def set_usta_status_tx(conn: sqlite3.Connection, user_id: int, status: str) -> Optional[sqlite3.Row]:
+    return conn.execute("UPDATE ustalar SET status=?, updated_at=datetime('now') WHERE user_id=? RETURNING *;",
+                        (status, user_id)).fetchone()
+
+def set_usta_status_sync(user_id: int, status: str) -> Optional[sqlite3.Row]:
+    return write_sync(set_usta_status_tx, user_id, status)
 
 async def set_usta_status(user_id: int, status: str) -> None:
-    await asyncio.to_thread(set_usta_status_sync, user_id, status)
+    row = await db_write(set_usta_status_tx, user_id, status)
+    usta_cache.write(user_id, row)
+
+def set_usta_active_tx(conn: sqlite3.Connection, user_id: int, is_active: int) -> Optional[sqlite3.Row]:
+    old = conn.execute("SELECT region, job, is_active FROM ustalar WHERE user_id=?;", (user_id,)).fetchone()
+    row = conn.execute("UPDATE ustalar SET is_active=?, updated_at=datetime('now') WHERE user_id=? RETURNING *;",
+                       (is_active, user_id)).fetchone()
+    conn.execute("UPDATE usta_categories SET is_active=? WHERE usta_id=?;", (is_active, user_id))
+    track_active_tx(conn, old, row)
+    return row
 
-def set_usta_active_sync(user_id: int, is_active: int) -> None:
-    conn = db_connect()
-    cur = conn.cursor()
-    cur.execute("UPDATE ustalar SET is_active=?, updated_at=datetime('now') WHERE user_id=?;", (is_active, user_id))
-    conn.commit()
-    conn.close()
+def set_usta_active_sync(user_id: int, is_active: int) -> Optional[sqlite3.Row]:
+    return write_sync(set_usta_active_tx, user_id, is_active)
 
 async def set_usta_active(user_id: int, is_active: int) -> None:
-    await asyncio.to_thread(set_usta_active_sync, user_id, is_active)
+    row = await db_write(set_usta_active_tx, user_id, is_active)
+    usta_cache.write(user_id, row)
 
-def list_ustalar_sync(limit: int = 30) -> List[sqlite3.Row]:
+# Sahifalar: "next" - eskiroqlar (kursordan keyin), "prev" - yangiroqlar.
+# limit+1 qator olinadi: ortiqchasi bo'lsa, o'sha tomonda yana sahifa bor.
+def list_ustalar_page_sync(cursor: Optional[Tuple[str, int]], direction: str = "next",
+                           limit: int = PAGE_SIZE) -> List[sqlite3.Row]:
     conn = db_connect()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT user_id, name, phone, job, region, status, is_active, updated_at
-        FROM ustalar
-        ORDER BY updated_at DESC
+    cols = "user_id, name, phone, job, region, status, is_active, updated_at"
+    if cursor is None:
+        return conn.execute(f"""
+            SELECT {cols} FROM ustalar
+            ORDER BY updated_at DESC, user_id DESC
+            LIMIT ?;
+        """, (limit + 1,)).fetchall()
+    if direction == "next":
+        return conn.execute(f"""
+            SELECT {cols} FROM ustalar
+            WHERE (updated_at, user_id) < (?, ?)
+            ORDER BY updated_at DESC, user_id DESC
+            LIMIT ?;
+        """, (*cursor, limit + 1)).fetchall()
+    rows = conn.execute(f"""
+        SELECT {cols} FROM ustalar
+        WHERE (updated_at, user_id) > (?, ?)
+        ORDER BY updated_at ASC, user_id ASC
         LIMIT ?;
-    """, (limit,))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
-
-async def list_ustalar(limit: int = 30) -> List[sqlite3.Row]:
-    return await asyncio.to_thread(list_ustalar_sync, limit)
-
-def insert_buyurtma_sync(user_id: int, ish_turi: str, region: str, phone: str, comment: str) -> int:
+    """, (*cursor, limit + 1)).fetchall()
+    return rows[::-1]
+
+async def list_ustalar_page(cursor: Optional[Tuple[str, int]], direction: str = "next",
+                            limit: int = PAGE_SIZE) -> List[sqlite3.Row]:
+    return await run_db(list_ustalar_page_sync, cursor, direction, limit)
+
+# buyurtma va uning outbox yozuvlari bitta tranzaksiyada
+def insert_buyurtma_tx(conn: sqlite3.Connection, user_id: int, ish_turi: str, region: str, phone: str, comment: str,
+                       usta_ids: List[int] = (), next_wave_at: Optional[float] = None) -> int:
+    category_id = next(iter(job_taxonomy.resolve(ish_turi)), None)
+    # mijoz matni taksonomiyani o'stirmaydi: notanish tuman o'rniga viloyat (yoki NULL)
+    region_id = lookup_region(conn, region)
+    order_id = conn.execute("""
+    INSERT INTO buyurtmalar(user_id, ish_turi, region, phone, comment, next_wave_at, category_id, region_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+    """, (user_id, ish_turi, region, phone, comment, next_wave_at, category_id, region_id)).lastrowid
+    conn.execute("""
+        INSERT INTO order_rollups(day, category_id, region_id, created) VALUES (date('now'), ?, ?, 1)
+        ON CONFLICT(day, category_id, region_id) DO UPDATE SET created = created + 1;
+    """, (category_id or 0, region_id or 0))
+    conn.executemany("INSERT OR IGNORE INTO order_deliveries(order_id, usta_id) VALUES (?, ?);",
+                     [(order_id, usta_id) for usta_id in usta_ids])
+    return order_id
+
+def insert_buyurtma_sync(user_id: int, ish_turi: str, region: str, phone: str, comment: str,
+                         usta_ids: List[int] = (), next_wave_at: Optional[float] = None) -> int:
+    return write_sync(insert_buyurtma_tx, user_id, ish_turi, region, phone, comment, list(usta_ids), next_wave_at)
+
+async def insert_buyurtma(user_id: int, ish_turi: str, region: str, phone: str, comment: str,
+                          usta_ids: List[int] = (), next_wave_at: Optional[float] = None) -> int:
+    return await db_write(insert_buyurtma_tx, user_id, ish_turi, region, phone, comment, list(usta_ids),
+                          next_wave_at)
+
+def _buyurtmalar_page(conn: sqlite3.Connection, schema: str, cursor: Optional[int], direction: str,
+                      limit: int) -> List[sqlite3.Row]:
+    cols = "id, user_id, ish_turi, region, phone, comment, status, created_at"
+    table = f"{schema}.buyurtmalar"
+    if cursor is None:
+        return conn.execute(f"SELECT {cols} FROM {table} ORDER BY id DESC LIMIT ?;", (limit,)).fetchall()
+    if direction == "next":
+        return conn.execute(f"SELECT {cols} FROM {table} WHERE id < ? ORDER BY id DESC LIMIT ?;",
+                            (cursor, limit)).fetchall()
+    return conn.execute(f"SELECT {cols} FROM {table} WHERE id > ? ORDER BY id ASC LIMIT ?;",
+                        (cursor, limit)).fetchall()
+
+# Avval hot jadval; arxiv oylari faqat sahifaga qator berishi mumkin bo'lsa ATTACH qilinadi.
+def list_buyurtmalar_page_sync(cursor: Optional[int], direction: str = "next",
+                               limit: int = PAGE_SIZE) -> List[sqlite3.Row]:
     conn = db_connect()
-    cur = conn.cursor()
-    cur.execute("""
-    INSERT INTO buyurtmalar(user_id, ish_turi, region, phone, comment)
-    VALUES (?, ?, ?, ?, ?);
-    """, (user_id, ish_turi, region, phone, comment))
-    conn.commit()
-    bid = cur.lastrowid
-    conn.close()
-    return bid
-
-async def insert_buyurtma(user_id: int, ish_turi: str, region: str, phone: str, comment: str) -> int:
-    return await asyncio.to_thread(insert_buyurtma_sync, user_id, ish_turi, region, phone, comment)
-
-def list_buyurtmalar_sync(limit: int = 30) -> List[sqlite3.Row]:
-    conn = db_connect()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, user_id, ish_turi, region, phone, comment, created_at
-        FROM buyurtmalar
-        ORDER BY id DESC
-        LIMIT ?;
-    """, (limit,))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
-
-async def list_buyurtmalar(limit: int = 30) -> List[sqlite3.Row]:
-    return await asyncio.to_thread(list_buyurtmalar_sync, limit)
+    desc = cursor is None or direction == "next"
+    rows = _buyurtmalar_page(conn, "main", cursor, direction, limit + 1)
+    for month, min_id, max_id in archive_months_sync(conn, desc):
+        if cursor is not None and (min_id >= cursor if desc else max_id <= cursor):
+            continue
+        if len(rows) > limit and (rows[limit]["id"] > max_id if desc else rows[limit]["id"] < min_id):
+            break
+        with attached_archive(conn, month) as schema:
+            rows += _buyurtmalar_page(conn, schema, cursor, direction, limit + 1)
+        rows = list({r["id"]: r for r in reversed(rows)}.values())  # takror bo'lsa hot qator qoladi
+        rows.sort(key=lambda r: r["id"], reverse=desc)
+        rows = rows[:limit + 1]
+    return rows if desc else rows[::-1]
+
+async def list_buyurtmalar_page(cursor: Optional[int], direction: str = "next",
+                                limit: int = PAGE_SIZE) -> List[sqlite3.Row]:
+    return await run_db(list_buyurtmalar_page_sync, cursor, direction, limit)
+
+# Reyting: avval bo'sh ustalar, keyin qabul qilish ulushi (Laplace bilan) minus bugungi yuklama,
+# keyin o'rtacha javob vaqti. usta_stats PK bo'yicha ulanadi, buyurtmalar agregatsiyasi yo'q.
+# Nomzodlar usta_categories (category_id, region_id, is_active) indeksidan olinadi.
+# exclude_order: shu buyurtma allaqachon yuborilgan ustalar chiqarib tashlanadi (keyingi sahifa)
+def match_ustalar(conn: sqlite3.Connection, category_id: Optional[int], region_ids: List[int], limit: int,
+                  exclude_order: Optional[int] = None) -> List[sqlite3.Row]:
+    if category_id is None or not region_ids or limit <= 0:
+        return []
+    return conn.execute(f"""
+    SELECT u.user_id, u.name, u.phone, u.job, u.region, u.status
+    FROM usta_categories c
+    CROSS JOIN ustalar u ON u.user_id = c.usta_id
+    LEFT JOIN usta_stats s ON s.user_id = u.user_id
+    WHERE c.category_id = ?
+      AND c.region_id IN ({",".join("?" * len(region_ids))})
+      AND c.is_active = 1
+      AND NOT EXISTS (SELECT 1 FROM order_deliveries d WHERE d.order_id=? AND d.usta_id=u.user_id)
+    ORDER BY u.status = ? DESC,
+             (COALESCE(s.accepts, 0) + 1.0) / (COALESCE(s.offers, 0) + 2)
+               - ? * (CASE WHEN s.day = date('now') THEN s.day_accepts ELSE 0 END) DESC,
+             COALESCE(s.response_secs / NULLIF(s.responses, 0), 1e9),
+             u.updated_at DESC
+    LIMIT ?;
+    """, (category_id, *region_ids, exclude_order, BTN_FREE, MATCH_LOAD_PENALTY, limit)).fetchall()
 
 def find_matching_ustalar_sync(ish_turi: str, region: str, limit: int = 10) -> List[sqlite3.Row]:
     conn = db_connect()
-    cur = conn.cursor()
-    cur.execute("""
-    SELECT user_id, name, phone, job, region, status
-    FROM ustalar
-    WHERE is_active=1
-      AND lower(job) LIKE '%' || lower(?) || '%'
-      AND lower(region) LIKE '%' || lower(?) || '%'
-    ORDER BY updated_at DESC
-    LIMIT ?;
-    """, (ish_turi, region, limit))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    category_id = next(iter(job_taxonomy.resolve(ish_turi)), None)
+    return match_ustalar(conn, category_id, region_scope(conn, lookup_region(conn, region)), limit)
 
 async def find_matching_ustalar(ish_turi: str, region: str, limit: int = 10) -> List[sqlite3.Row]:
-    return await asyncio.to_thread(find_matching_ustalar_sync, ish_turi, region, limit)
+    return await run_db(find_matching_ustalar_sync, ish_turi, region, limit)
 
-# ✅ BUYURTMA QABUL QILISH (DB)
-def accept_buyurtma_sync(order_id: int, usta_id: int) -> bool:
+# 🌊 KEYINGI TO'LQIN: avval aynan hududdagi keyingi ustalar, yetmasa qo'shni viloyatlar.
+# Qaytaradi: (yangi usta_id lar, keyingi to'lqin vaqti yoki None)
+def redispatch_order_tx(conn: sqlite3.Connection, order_id: int, now: float) -> Tuple[List[int], Optional[float]]:
+    order = conn.execute("""
+        SELECT category_id, region_id, wave, next_wave_at FROM buyurtmalar
+        WHERE id=? AND status='new';
+    """, (order_id,)).fetchone()
+    if not order or order["next_wave_at"] is None:
+        return [], None
+    if order["next_wave_at"] > now:
+        return [], order["next_wave_at"]
+
+    category_id, region_id = order["category_id"], order["region_id"]
+    rows = match_ustalar(conn, category_id, region_scope(conn, region_id), WAVE_SIZE, order_id)
+    rows += match_ustalar(conn, category_id, neighbour_scope(conn, region_id), WAVE_SIZE - len(rows), order_id)
+    usta_ids = list(dict.fromkeys(int(r["user_id"]) for r in rows))
+    conn.executemany("INSERT OR IGNORE INTO order_deliveries(order_id, usta_id) VALUES (?, ?);",
+                     [(order_id, usta_id) for usta_id in usta_ids])
+
+    wave = order["wave"] + 1
+    next_at = now + REDISPATCH_TIMEOUT if wave < REDISPATCH_MAX_WAVES else None
+    conn.execute("UPDATE buyurtmalar SET wave=?, next_wave_at=? WHERE id=?;", (wave, next_at, order_id))
+    return usta_ids, next_at
+
+def scheduled_orders_sync() -> List[sqlite3.Row]:
     conn = db_connect()
-    cur = conn.cursor()
-    cur.execute("""
+    return conn.execute("""
+        SELECT id, next_wave_at FROM buyurtmalar
+        WHERE status='new' AND next_wave_at IS NOT NULL AND user_id % ? = ?;
+    """, (WORKER_COUNT, WORKER_INDEX)).fetchall()
+
+# ✅ BUYURTMA QABUL QILISH (DB)
+# qabul qilingan buyurtma qatorini qaytaradi (allaqachon olingan bo'lsa None)
+def accept_buyurtma_tx(conn: sqlite3.Connection, order_id: int, usta_id: int) -> Optional[sqlite3.Row]:
+    order = conn.execute("""
         UPDATE buyurtmalar
         SET status='accepted', accepted_by=?, accepted_at=datetime('now')
-        WHERE id=? AND status='new';
-    """, (usta_id, order_id))
-    ok = cur.rowcount == 1
-    conn.commit()
-    conn.close()
-    return ok
-
-async def accept_buyurtma(order_id: int, usta_id: int) -> bool:
-    return await asyncio.to_thread(accept_buyurtma_sync, order_id, usta_id)
+        WHERE id=? AND status='new'
+        RETURNING id, user_id, ish_turi, region, phone, comment, created_at, category_id, region_id;
+    """, (usta_id, order_id)).fetchone()
+    if order is None:
+        return None
+    # order_rollups: buyurtma yaratilgan kun qatoriga
+    conn.execute("""
+        INSERT INTO order_rollups(day, category_id, region_id, accepted, accept_secs)
+        VALUES (date(?1), ?2, ?3, 1, (julianday('now') - julianday(?1)) * 86400)
+        ON CONFLICT(day, category_id, region_id) DO UPDATE SET
+            accepted = accepted + 1,
+            accept_secs = accept_secs + excluded.accept_secs;
+    """, (order["created_at"], order["category_id"] or 0, order["region_id"] or 0))
+    # usta_stats: qabul soni, bugungi yuklama, taklifdan qabulgacha vaqt
+    conn.execute("""
+        INSERT INTO usta_stats(user_id, accepts, responses, response_secs, day, day_accepts)
+        SELECT ?, 1, d.sent_at IS NOT NULL,
+               COALESCE((julianday('now') - julianday(d.sent_at)) * 86400, 0), date('now'), 1
+        FROM (SELECT 1) LEFT JOIN order_deliveries d ON d.order_id=? AND d.usta_id=?
+        WHERE true
+        ON CONFLICT(user_id) DO UPDATE SET
+            accepts = accepts + 1,
+            responses = responses + excluded.responses,
+            response_secs = response_secs + excluded.response_secs,
+            day_accepts = CASE WHEN day = excluded.day THEN day_accepts + 1 ELSE 1 END,
+            day = excluded.day;
+    """, (usta_id, order_id, usta_id))
+    # hali yuborilmagan takliflar endi kerak emas
+    conn.execute("UPDATE order_deliveries SET status='skipped' WHERE order_id=? AND status='pending';", (order_id,))
+    return order
+
+def accept_buyurtma_sync(order_id: int, usta_id: int) -> Optional[sqlite3.Row]:
+    return write_sync(accept_buyurtma_tx, order_id, usta_id)
+
+async def accept_buyurtma(order_id: int, usta_id: int) -> Optional[sqlite3.Row]:
+    return await db_write(accept_buyurtma_tx, order_id, usta_id)
+
+# Qabul qilishning butun yo'li bitta tranzaksiyada: usta, buyurtma (RETURNING)
+# va taklifni olgan boshqa ustalarning xabarlari (qaytarib olish uchun).
+# Qaytaradi: (usta, order, others); usta None = ro'yxatdan o'tmagan, order None = allaqachon olingan
+def accept_order_tx(conn: sqlite3.Connection, order_id: int, usta_id: int):
+    usta = conn.execute("SELECT * FROM ustalar WHERE user_id=?;", (usta_id,)).fetchone()
+    if usta is None:
+        return None, None, []
+    order = accept_buyurtma_tx(conn, order_id, usta_id)
+    if order is None:
+        return usta, None, []
+    others = conn.execute("""
+        SELECT usta_id, message_id FROM order_deliveries
+        WHERE order_id=? AND status='sent' AND message_id IS NOT NULL AND usta_id != ?;
+    """, (order_id, usta_id)).fetchall()
+    return usta, order, others
+
+async def accept_order(order_id: int, usta_id: int):
+    return await db_write(accept_order_tx, order_id, usta_id)
 
 def get_buyurtma_sync(order_id: int) -> Optional[sqlite3.Row]:
     conn = db_connect()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM buyurtmalar WHERE id=?;", (order_id,))
-    row = cur.fetchone()
-    conn.close()
-    return row
+    row = conn.execute("SELECT * FROM buyurtmalar WHERE id=?;", (order_id,)).fetchone()
+    if row is not None:
+        return row
+    for (month,) in conn.execute("SELECT month FROM archive_index WHERE ? BETWEEN min_id AND max_id;",
+                                 (order_id,)).fetchall():
+        with attached_archive(conn, month) as schema:
+            row = conn.execute(f"SELECT * FROM {schema}.buyurtmalar WHERE id=?;", (order_id,)).fetchone()
+        if row is not None:
+            return row
+    return None
 
 async def get_buyurtma(order_id: int) -> Optional[sqlite3.Row]:
-    return await asyncio.to_thread(get_buyurtma_sync, order_id)
+    return await run_db(get_buyurtma_sync, order_id)
+
+# 🗄 ARXIV: ARCHIVE_DIR/buyurtmalar_YYYY_MM.db, kerak bo'lganda ATTACH qilinadi
+def archive_path(month: str) -> Path:
+    return ARCHIVE_DIR / f"buyurtmalar_{month}.db"
+
+@contextmanager
+def attached_archive(conn: sqlite3.Connection, month: str):
+    conn.execute("ATTACH DATABASE ? AS arc;", (str(archive_path(month)),))
+    try:
+        yield "arc"
+    finally:
+        conn.execute("DETACH DATABASE arc;")
+
+def archive_months_sync(conn: sqlite3.Connection, newest_first: bool = True) -> List[tuple]:
+    order = "max_id DESC" if newest_first else "min_id ASC"
+    return [tuple(r) for r in conn.execute(f"SELECT month, min_id, max_id FROM archive_index ORDER BY {order};")]
+
+def _ensure_archive_table(conn: sqlite3.Connection) -> List[str]:
+    # arxiv jadvali hot jadval sxemasidan; keyin qo'shilgan ustunlar ham qo'shiladi
+    sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type='table' AND name='buyurtmalar';").fetchone()[0]
+    conn.execute(re.sub(r"^CREATE TABLE\s+(IF NOT EXISTS\s+)?\"?buyurtmalar\"?",
+                        "CREATE TABLE IF NOT EXISTS arc.buyurtmalar", sql))
+    main_cols = conn.execute("PRAGMA main.table_info(buyurtmalar);").fetchall()
+    arc_cols = {r["name"] for r in conn.execute("PRAGMA arc.table_info(buyurtmalar);")}
+    for col in main_cols:
+        if col["name"] not in arc_cols:
+            conn.execute(f"ALTER TABLE arc.buyurtmalar ADD COLUMN {col['name']} {col['type']};")
+    return [c["name"] for c in main_cols]
+
+ARCHIVABLE = "(status='accepted' OR (status='new' AND next_wave_at IS NULL))"
+
+# Arxivlash o'tishining chegarasi: yoshi yetgan eng so'nggi buyurtma id si (yo'q - None).
+# id lar created_at bilan birga o'sadi, shuning uchun bo'laklar (after, upto] rowid oralig'ida.
+def archive_cutoff_sync(age_days: float) -> Optional[int]:
+    conn = db_connect()
+    row = conn.execute("""
+        SELECT id FROM buyurtmalar WHERE created_at < datetime('now', ?) ORDER BY created_at DESC LIMIT 1;
+    """, (f"-{age_days} days",)).fetchone()
+    return row[0] if row else None
+
+# Bitta bo'lak: after dan keyingi ARCHIVE_BATCH ta yakunlangan buyurtma arxiv fayliga
+# yoziladi (faqat arxiv fayli qulflanadi). Hot jadvaldan o'chirish keyin DBWriter orqali.
+# Qaytaradi: [(month, [(id, status), ...]), ...] - nusxa olingandagi holat
+def archive_copy_sync(age_days: float, after: int, upto: int,
+                      limit: int = ARCHIVE_BATCH) -> List[Tuple[str, List[Tuple[int, str]]]]:
+    conn = db_connect()
+    rows = conn.execute(f"""
+        SELECT id, status, strftime('%Y_%m', created_at) AS month FROM buyurtmalar NOT INDEXED
+        WHERE id > ? AND id <= ? AND created_at < datetime('now', ?) AND {ARCHIVABLE}
+        ORDER BY id LIMIT ?;  -- rowid oralig'i tartibda: LIMIT ta topilganda to'xtaydi
+    """, (after, upto, f"-{age_days} days", limit)).fetchall()
+    groups: Dict[str, List[Tuple[int, str]]] = {}
+    for r in rows:
+        groups.setdefault(r["month"], []).append((r["id"], r["status"]))
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    for month, pairs in groups.items():
+        ids = [order_id for order_id, _ in pairs]
+        with attached_archive(conn, month):
+            cols = _ensure_archive_table(conn)
+            select = ", ".join("CASE WHEN status='new' THEN 'expired' ELSE status END" if c == "status" else c
+                               for c in cols)
+            conn.execute("BEGIN;")
+            try:
+                conn.execute(f"""
+                    INSERT OR REPLACE INTO arc.buyurtmalar({", ".join(cols)})
+                    SELECT {select} FROM main.buyurtmalar
+                    WHERE id IN ({",".join("?" * len(ids))});
+                """, ids)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+    return list(groups.items())
+
+def archive_commit_tx(conn: sqlite3.Connection,
+                      groups: List[Tuple[str, List[Tuple[int, str]]]]) -> Tuple[int, List[Tuple[str, List[int]]]]:
+    # Faqat nusxa olingandan beri o'zgarmagan qatorlar o'chiriladi: oraliqda qabul
+    # qilingan buyurtma hot jadvalda qoladi, arxivdagi eskirgan nusxasi qaytariladi.
+    deleted = 0
+    stale: List[Tuple[str, List[int]]] = []
+    for month, pairs in groups:
+        ids = [row[0] for order_id, status in pairs for row in conn.execute(
+            f"DELETE FROM buyurtmalar WHERE id=? AND status=? AND {ARCHIVABLE} RETURNING id;", (order_id, status))]
+        gone = set(ids)
+        skipped = [order_id for order_id, _ in pairs if order_id not in gone]
+        if skipped:
+            stale.append((month, skipped))
+        if not ids:
+            continue
+        deleted += len(ids)
+        conn.execute(f"DELETE FROM order_deliveries WHERE order_id IN ({','.join('?' * len(ids))});", ids)
+        conn.execute("""
+            INSERT INTO archive_index(month, min_id, max_id, rows) VALUES (?, ?, ?, ?)
+            ON CONFLICT(month) DO UPDATE SET
+                min_id = min(min_id, excluded.min_id),
+                max_id = max(max_id, excluded.max_id),
+                rows = rows + excluded.rows;
+        """, (month, min(ids), max(ids), len(ids)))
+    return deleted, stale
+
+def archive_discard_sync(stale: List[Tuple[str, List[int]]]) -> None:
+    # hot jadvalda qolgan buyurtmalarning arxivdagi nusxalari (ikki marta sanalmasin)
+    conn = db_connect()
+    for month, ids in stale:
+        with attached_archive(conn, month):
+            conn.execute(f"DELETE FROM arc.buyurtmalar WHERE id IN ({','.join('?' * len(ids))});", ids)
+            conn.commit()
+
+# 📊 STATISTIKA (order_rollups / usta_rollups)
+# src - buyurtmalar o'qiladigan ulanish (asosiy DB yoki arxiv fayli), conn - asosiy DB
+# (taksonomiyadan oldingi arxiv qatorlari uchun hudud qidiruvi)
+def order_rollups_from(src: sqlite3.Connection, conn: sqlite3.Connection) -> List[tuple]:
+    cols = {r[1] for r in src.execute("PRAGMA table_info(buyurtmalar);")}
+    ids = "category_id, region_id" if "category_id" in cols else "NULL AS category_id, NULL AS region_id"
+    rows = src.execute(f"""
+        SELECT date(created_at) AS day, category_id,
+               region_id, CASE WHEN category_id IS NULL THEN ish_turi END AS ish_turi,
+               CASE WHEN category_id IS NULL THEN region END AS region, count(*) AS created,
+               sum(status='accepted') AS accepted,
+               COALESCE(sum(CASE WHEN status='accepted'
+                            THEN (julianday(accepted_at) - julianday(created_at)) * 86400 END), 0) AS secs
+        FROM (SELECT created_at, accepted_at, status, ish_turi, region, {ids} FROM buyurtmalar)
+        GROUP BY 1, 2, 3, 4, 5;
+    """).fetchall()
+    out = []
+    for r in rows:
+        category_id, region_id = r[1], r[2]
+        if category_id is None and r[3] is not None:
+            # taksonomiyadan oldin arxivlangan buyurtma: matndan, buyurtma yozilgandagi kabi
+            category_id = next(iter(job_taxonomy.resolve(r[3])), None)
+            region_id = lookup_region(conn, r[4])
+        out.append((r[0], category_id or 0, region_id or 0, r[5], r[6], r[7]))
+    return out
+
+def usta_rollups_now(conn: sqlite3.Connection) -> List[tuple]:
+    counts: Dict[Tuple[int, int], int] = {}
+    for r in conn.execute("SELECT job, region, count(*) FROM ustalar WHERE is_active=1 GROUP BY 1, 2;").fetchall():
+        key = usta_rollup_key(conn, r)
+        counts[key] = counts.get(key, 0) + r[2]
+    return [(cid, rid, n) for (cid, rid), n in counts.items()]
+
+def replace_rollups_tx(conn: sqlite3.Connection, orders: List[tuple], ustalar: List[tuple]) -> None:
+    # buyurtmalar to'liq qayta hisoblanadi; ustalar tarixi tiklanmaydi - faqat bugungi holat
+    conn.execute("DELETE FROM order_rollups;")
+    conn.executemany("""
+        INSERT INTO order_rollups(day, category_id, region_id, created, accepted, accept_secs)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(day, category_id, region_id) DO UPDATE SET
+            created = created + excluded.created,
+            accepted = accepted + excluded.accepted,
+            accept_secs = accept_secs + excluded.accept_secs;
+    """, orders)
+    conn.execute("DELETE FROM usta_rollups WHERE day = date('now');")
+    conn.executemany("INSERT INTO usta_rollups(day, category_id, region_id, active) VALUES (date('now'), ?, ?, ?);",
+                     ustalar)
+
+# To'liq qayta hisoblash (hot jadval + arxivlar). Arxivlar alohida faqat-o'qish ulanishi
+# bilan o'qiladi (ATTACH emas): migratsiya tranzaksiyasi ichida ham ishlaydi.
+def collect_rollups_from(conn: sqlite3.Connection) -> Tuple[List[tuple], List[tuple]]:
+    orders = order_rollups_from(conn, conn)
+    for month, _, _ in archive_months_sync(conn):
+        path = archive_path(month)
+        if not path.exists():
+            log.warning("stats: archive %s is missing, skipped", path)
+            continue
+        src = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            orders += order_rollups_from(src, conn)
+        finally:
+            src.close()
+    return orders, usta_rollups_now(conn)
+
+# O'qish run_db da, yozish bitta writer tranzaksiyasida. O'qish va yozish orasidagi
+# buyurtmalar qayta hisoblashda tushib qolishi mumkin - admin buyrug'i, kamdan-kam.
+def collect_rollups_sync() -> Tuple[List[tuple], List[tuple]]:
+    return collect_rollups_from(db_connect())
+
+async def rebuild_rollups() -> int:
+    orders, ustalar = await run_db(collect_rollups_sync)
+    await db_write(replace_rollups_tx, orders, ustalar)
+    return sum(r[3] for r in orders)
+
+def admin_stats_sync(days: int = 7) -> dict:
+    conn = db_connect()
+    since = f"-{days - 1} days"
+    orders = {r["day"]: r for r in conn.execute("""
+        SELECT day, sum(created) AS created, sum(accepted) AS accepted, sum(accept_secs) AS secs
+        FROM order_rollups WHERE day >= date('now', ?) GROUP BY day;
+    """, (since,))}
+    # faol ustalar: oyna ichidagi snapshotlar va oynadan oldingi oxirgisi (o'zgarishsiz kunlar uchun)
+    active = conn.execute("""
+        SELECT day, sum(active) AS n FROM usta_rollups
+        WHERE day >= COALESCE((SELECT max(day) FROM usta_rollups WHERE day < date('now', ?1)), date('now', ?1))
+        GROUP BY day ORDER BY day;
+    """, (since,)).fetchall()
+    window = [r[0] for r in conn.execute(
+        "WITH RECURSIVE d(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM d WHERE n < ?) "
+        "SELECT date('now', '-' || n || ' days') FROM d;", (days - 1,))]
+    per_day, current, i = [], 0, 0
+    for day in reversed(window):
+        while i < len(active) and active[i]["day"] <= day:
+            current, i = active[i]["n"], i + 1
+        o = orders.get(day)
+        per_day.append({"day": day, "created": o["created"] if o else 0, "accepted": o["accepted"] if o else 0,
+                        "secs": o["secs"] if o else 0.0, "active": current})
+    per_day.reverse()
+    top_regions = conn.execute("""
+        SELECT region_id, sum(created) AS n FROM order_rollups WHERE day >= date('now', ?)
+        GROUP BY region_id ORDER BY n DESC LIMIT 5;
+    """, (since,)).fetchall()
+    region_names = dict(conn.execute(
+        f"SELECT id, name FROM regions WHERE id IN ({','.join('?' * len(top_regions))});",
+        [r[0] for r in top_regions]).fetchall()) if top_regions else {}
+    top = {
+        "region": [{"name": region_names.get(r[0], "-"), "n": r[1]} for r in top_regions],
+        "job": [{"name": job_taxonomy.names.get(r[0], "-"), "n": r[1]} for r in conn.execute("""
+            SELECT category_id, sum(created) AS n FROM order_rollups WHERE day >= date('now', ?)
+            GROUP BY category_id ORDER BY n DESC LIMIT 5;
+        """, (since,))],
+        "active": [{"name": job_taxonomy.names.get(r[0], "-"), "n": r[1]} for r in conn.execute("""
+            SELECT category_id, sum(active) AS n FROM usta_rollups
+            WHERE day = (SELECT max(day) FROM usta_rollups)
+            GROUP BY category_id HAVING n > 0 ORDER BY n DESC LIMIT 5;
+        """)],
+    }
+    return {"per_day": per_day, "top": top, "active": per_day[0]["active"], "days": days}
+
+async def admin_stats() -> dict:
+    return await run_db(admin_stats_sync)
+
+# 📣 TARQATMA (broadcasts)
+def create_broadcast_tx(conn: sqlite3.Connection, admin_id: int, text: str,
+                        chat_id: int, message_id: int) -> Optional[sqlite3.Row]:
+    # bir vaqtda bitta tarqatma; total - boshlanishdagi faol ustalar soni (remaining uchun)
+    if conn.execute("SELECT 1 FROM broadcasts WHERE status='running';").fetchone():
+        return None
+    return conn.execute("""
+        INSERT INTO broadcasts(admin_id, text, total, chat_id, message_id)
+        VALUES (?, ?, (SELECT count(*) FROM ustalar WHERE is_active=1), ?, ?)
+        RETURNING *;
+    """, (admin_id, text, chat_id, message_id)).fetchone()
+
+def broadcast_audience_sync() -> int:
+    # qabul qiluvchilar faqat faol ustalar: is_active=0 - o'zi nofaol bo'lgan, admin
+    # bloklagan yoki botni bloklagan usta (alohida belgi yo'q), ularga yuborilmaydi
+    conn = db_connect()
+    return conn.execute("SELECT count(*) FROM ustalar WHERE is_active=1;").fetchone()[0]
+
+def running_broadcast_sync() -> Optional[sqlite3.Row]:
+    conn = db_connect()
+    return conn.execute("SELECT * FROM broadcasts WHERE status='running' ORDER BY id LIMIT 1;").fetchone()
+
+def broadcast_recipients_sync(cursor: int, limit: int = BROADCAST_BATCH) -> List[int]:
+    # +is_active: idx_ustalar_active emas, PK diapazoni (aks holda har bo'lakda saralash)
+    conn = db_connect()
+    return [r[0] for r in conn.execute("""
+        SELECT user_id FROM ustalar WHERE user_id > ? AND +is_active=1 ORDER BY user_id LIMIT ?;
+    """, (cursor, limit))]
+
+def get_broadcast_sync(broadcast_id: int) -> Optional[sqlite3.Row]:
+    conn = db_connect()
+    return conn.execute("SELECT * FROM broadcasts WHERE id=?;", (broadcast_id,)).fetchone()
+
+def broadcast_progress_tx(conn: sqlite3.Connection, broadcast_id: int, cursor: Optional[int],
+                          sent: int, failed: int) -> Optional[sqlite3.Row]:
+    # cursor=None - qabul qiluvchilar tugadi. Bekor qilingan tarqatma o'zgarmaydi.
+    return conn.execute("""
+        UPDATE broadcasts SET
+            cursor = COALESCE(?2, cursor),
+            sent = sent + ?3,
+            failed = failed + ?4,
+            status = CASE WHEN ?2 IS NULL THEN 'done' ELSE status END,
+            finished_at = CASE WHEN ?2 IS NULL THEN datetime('now') END
+        WHERE id = ?1 AND status = 'running'
+        RETURNING *;
+    """, (broadcast_id, cursor, sent, failed)).fetchone()
+
+def cancel_broadcast_tx(conn: sqlite3.Connection, broadcast_id: int) -> Optional[sqlite3.Row]:
+    return conn.execute("""
+        UPDATE broadcasts SET status='cancelled', finished_at=datetime('now')
+        WHERE id=? AND status='running' RETURNING *;
+    """, (broadcast_id,)).fetchone()
+
+async def create_broadcast(admin_id: int, text: str, chat_id: int, message_id: int) -> Optional[sqlite3.Row]:
+    return await db_write(create_broadcast_tx, admin_id, text, chat_id, message_id)
+
+async def cancel_broadcast(broadcast_id: int) -> Optional[sqlite3.Row]:
+    return await db_write(cancel_broadcast_tx, broadcast_id)
+
+# 📬 OUTBOX (order_deliveries)
+def pending_deliveries_sync(now: float, limit: int = DELIVERY_BATCH) -> List[sqlite3.Row]:
+    conn = db_connect()
+    return conn.execute("""
+        SELECT d.id, d.order_id, d.usta_id, d.attempts,
+               b.ish_turi, b.region, b.phone, b.comment, b.status AS order_status
+        FROM order_deliveries d
+        JOIN buyurtmalar b ON b.id = d.order_id
+        WHERE d.status='pending' AND d.next_at <= ? AND d.usta_id % ? = ?
+        ORDER BY d.next_at
+        LIMIT ?;
+    """, (now, WORKER_COUNT, WORKER_INDEX, limit)).fetchall()
+
+def next_delivery_at_sync() -> Optional[float]:
+    conn = db_connect()
+    return conn.execute("SELECT min(next_at) FROM order_deliveries WHERE status='pending' AND usta_id % ? = ?;",
+                        (WORKER_COUNT, WORKER_INDEX)).fetchone()[0]
+
+# results: (status, message_id, error, next_at, delivery_id)
+def finish_deliveries_tx(conn: sqlite3.Connection, results: List[tuple]) -> None:
+    conn.executemany("""
+        UPDATE order_deliveries
+        SET status=?, message_id=?, error=?, next_at=?, attempts=attempts + 1,
+            sent_at=CASE WHEN ?1='sent' THEN datetime('now') ELSE sent_at END
+        WHERE id=?;
+    """, results)
+    conn.executemany("""
+        INSERT INTO usta_stats(user_id, offers)
+        SELECT usta_id, 1 FROM order_deliveries WHERE id=?
+        ON CONFLICT(user_id) DO UPDATE SET offers = offers + 1;
+    """, [(r[4],) for r in results if r[0] == "sent"])
+
+# ----------------- FSM STORAGE -----------------
+def fsm_load_sync(key: str) -> Optional[sqlite3.Row]:
+    conn = db_connect()
+    return conn.execute("SELECT state, data, updated_at FROM fsm_states WHERE key=?;", (key,)).fetchone()
+
+def fsm_flush_tx(conn: sqlite3.Connection, upserts: List[Tuple[str, Optional[str], str, float]],
+                 deletes: List[Tuple[str]]) -> None:
+    conn.executemany("""
+        INSERT INTO fsm_states(key, state, data, updated_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET
+            state=excluded.state, data=excluded.data, updated_at=excluded.updated_at;
+    """, upserts)
+    conn.executemany("DELETE FROM fsm_states WHERE key=?;", deletes)
+
+def fsm_purge_tx(conn: sqlite3.Connection, older_than: float) -> int:
+    return conn.execute("DELETE FROM fsm_states WHERE updated_at < ?;", (older_than,)).rowcount
+
+class SQLiteStorage(BaseStorage):
+    # Issiq qatlam (LRU) + write-behind: update_data lar har FSM_FLUSH_INTERVAL da
+    # bitta tranzaksiyaga yig'iladi. FSM_TTL dan eski holatlar bo'sh hisoblanadi.
+    def __init__(self, hot_size: int = FSM_HOT_SIZE, ttl: float = FSM_TTL,
+                 flush_interval: float = FSM_FLUSH_INTERVAL):
+        self.hot_size = hot_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        # key -> (state, data, updated_at)
+        self._hot: "OrderedDict[str, tuple]" = OrderedDict()
+        self._dirty: Dict[str, tuple] = {}
+        self._flushing: Dict[str, tuple] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._last_purge = time.time()
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or 0}:{key.destiny}"
+
+    def _remember(self, k: str, record: tuple) -> None:
+        self._hot[k] = record
+        self._hot.move_to_end(k)
+        while len(self._hot) > self.hot_size:
+            self._hot.popitem(last=False)
+
+    async def _load(self, k: str) -> tuple:
+        record = self._hot.get(k) or self._dirty.get(k) or self._flushing.get(k)
+        if record is None:
+            row = await run_db(fsm_load_sync, k)
+            if k in self._hot:
+                # DB dan o'qiyotganda kimdir yozib qo'ydi
+                record = self._hot[k]
+            elif row is None:
+                record = (None, {}, 0.0)
+            else:
+                record = (row["state"], json.loads(row["data"]), row["updated_at"])
+        if record[2] and record[2] < time.time() - self.ttl:
+            record = (None, {}, 0.0)
+        self._remember(k, record)
+        return record
+
+    def _store(self, k: str, state: Optional[str], data: Dict[str, Any]) -> None:
+        record = (state, data, time.time())
+        self._remember(k, record)
+        self._dirty[k] = record
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = self._key(key)
+        _, data, _ = await self._load(k)
+        self._store(k, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(self._key(key)))[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        k = self._key(key)
+        state, _, _ = await self._load(k)
+        self._store(k, state, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._load(self._key(key)))[1].copy()
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+        self._flushing, self._dirty = self._dirty, {}
+        upserts, deletes = [], []
+        for k, (state, data, updated_at) in self._flushing.items():
+            if state is None and not data:
+                deletes.append((k,))
+            else:
+                upserts.append((k, state, json.dumps(data, ensure_ascii=False), updated_at))
+        try:
+            await db_write(fsm_flush_tx, upserts, deletes)
+        except Exception:
+            # keyingi flush da qayta urinamiz (yangi yozuvlar ustun)
+            log.exception("fsm flush failed")
+            self._dirty = {**self._flushing, **self._dirty}
+        finally:
+            self._flushing = {}
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if time.time() - self._last_purge > FSM_PURGE_INTERVAL:
+                self._last_purge = time.time()
+                await db_write(fsm_purge_tx, self._last_purge - self.ttl)
+            if not self._dirty:
+                # navbatdagi yozuvda qayta ishga tushadi
+                self._task = None
+                return
+
+    def stats(self) -> dict:
+        return {"hot": len(self._hot), "dirty": len(self._dirty)}
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+fsm_storage = SQLiteStorage()
+dp = Dispatcher(storage=fsm_storage)
+
+@dp.shutdown()
+async def on_shutdown_storage():
+    await fsm_storage.close()
+
+# ----------------- TRACE -----------------
+TRACED = MetricCounter("bot_traced_updates_total", "Updates written to the trace file")
+PHONE_ANY_RE = re.compile(r"\+?\d[\d\s\-]{7,}\d")
+TRACE_NAME_KEYS = {"first_name", "last_name", "username", "title"}
+
+class TraceRecorder(BaseMiddleware):
+    # Har bir kiruvchi Update: {"t": kelgan vaqti, "update": anonim JSON} bitta qator.
+    # Bir foydalanuvchi doim bitta psevdonim oladi (FSM oqimi replayda saqlanadi).
+    # Worker rejimida har worker o'z fayliga yozadi (trace.w0.jsonl, ...).
+    def __init__(self, path: str, max_bytes: int, backups: int, salt: str):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.salt = salt.encode()
+        self._log: Optional[logging.Logger] = None
+
+    def _logger(self) -> logging.Logger:
+        if self._log is None:
+            path = self.path
+            if WORKER_COUNT > 1:
+                path = path.with_name(f"{path.stem}.w{WORKER_INDEX}{path.suffix}")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._log = logging.getLogger("ustaxizmati.trace")
+            self._log.propagate = False
+            self._log.setLevel(logging.INFO)
+            self._log.addHandler(handler)
+            log.info("trace: recording updates to %s", path)
+        return self._log
+
+    def pseudonym(self, value: int) -> int:
+        digest = hmac.new(self.salt, str(abs(value)).encode(), hashlib.sha256).digest()
+        pseudo = int.from_bytes(digest[:5], "big") + 1
+        return -pseudo if value < 0 else pseudo
+
+    def anonymize(self, obj: Any) -> Any:
+        if isinstance(obj, dict):
+            out = {}
+            for key, value in obj.items():
+                if key in ("id", "user_id") and isinstance(value, int):
+                    out[key] = self.pseudonym(value)
+                elif key in TRACE_NAME_KEYS and isinstance(value, str):
+                    out[key] = "anon"
+                elif key == "phone_number":
+                    out[key] = "+998900000000"
+                elif key in ("text", "caption") and isinstance(value, str):
+                    # foydalanuvchi matnidagi telefonlar (callback_data dagi sanalar emas)
+                    out[key] = PHONE_ANY_RE.sub("+998900000000", value)
+                else:
+                    out[key] = self.anonymize(value)
+            return out
+        if isinstance(obj, list):
+            return [self.anonymize(v) for v in obj]
+        return obj
+
+    async def __call__(self, handler, event, data):
+        try:
+            update = self.anonymize(event.model_dump(mode="json", exclude_none=True, by_alias=True))
+            self._logger().info(json.dumps({"t": time.time(), "update": update}, ensure_ascii=False))
+            TRACED.inc()
+        except Exception:
+            log.exception("trace: failed to record update %s", event.update_id)
+        return await handler(event, data)
+
+# ----------------- MIDDLEWARES -----------------
+if TRACE_PATH:
+    dp.update.outer_middleware(TraceRecorder(TRACE_PATH, TRACE_MAX_BYTES, TRACE_BACKUPS, TRACE_SALT or TOKEN))
+dp.update.outer_middleware(UpdateMetricsMiddleware())
+dp.message.middleware(HandlerMetricsMiddleware())
+dp.callback_query.middleware(HandlerMetricsMiddleware())
+
+MetricGauge("bot_usta_cache_size", "Cached master profiles", lambda: len(usta_cache._data))
+MetricGauge("bot_usta_cache_hits_total", "Master profile cache hits", lambda: usta_cache.hits, "counter")
+MetricGauge("bot_usta_cache_misses_total", "Master profile cache misses", lambda: usta_cache.misses, "counter")
+MetricGauge("bot_usta_cache_evictions_total", "Master profile cache evictions", lambda: usta_cache.evictions, "counter")
+MetricGauge("bot_fsm_hot_size", "FSM states held in memory", lambda: len(fsm_storage._hot))
+MetricGauge("bot_db_write_batches_total", "Group-committed write batches", lambda: db_writer.batches, "counter")
+MetricGauge("bot_db_writes_total", "Writes applied through the writer", lambda: db_writer.writes, "counter")
+
+# ----------------- PROFILING -----------------
+class SamplingProfiler:
+    # /profile: alohida threadda har PROFILE_INTERVAL da sys._current_frames() dan
+    # barcha threadlar (event loop, db_*, ...) steki olinadi. Faqat so'ralganda va
+    # berilgan vaqtga ishlaydi; o'chiq paytda hech qanday hook yo'q.
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.running = False
+
+    @staticmethod
+    def _label(code) -> str:
+        return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+    def sample(self, seconds: float) -> str:
+        me = threading.get_ident()
+        names = {}
+        samples: Dict[str, int] = {}
+        own: Dict[str, Dict[str, int]] = {}
+        cumulative: Dict[str, Dict[str, int]] = {}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                # db_0, db_1 ... bitta guruh
+                group = re.sub(r"_\d+$", "", names.get(ident, str(ident)))
+                samples[group] = samples.get(group, 0) + 1
+                top = self._label(frame.f_code)
+                mine = own.setdefault(group, {})
+                mine[top] = mine.get(top, 0) + 1
+                seen = set()
+                cum = cumulative.setdefault(group, {})
+                while frame is not None:
+                    label = self._label(frame.f_code)
+                    if label not in seen:
+                        seen.add(label)
+                        cum[label] = cum.get(label, 0) + 1
+                    frame = frame.f_back
+            time.sleep(self.interval)
+        return self.report(seconds, samples, own, cumulative)
+
+    @staticmethod
+    def report(seconds: float, samples: Dict[str, int], own: Dict[str, Dict[str, int]],
+               cumulative: Dict[str, Dict[str, int]], top: int = 30) -> str:
+        lines = [f"profil: {seconds:g} s, threadlar bo'yicha (cum% / self%)"]
+        for group, n in sorted(samples.items(), key=lambda kv: -kv[1]):
+            lines.append(f"\n== {group}: {n} namuna ==")
+            for label, count in sorted(cumulative[group].items(), key=lambda kv: -kv[1])[:top]:
+                self_pct = own[group].get(label, 0) * 100 / n
+                lines.append(f"{count * 100 / n:6.1f}% {self_pct:6.1f}%  {label}")
+        return "\n".join(lines) + "\n"
+
+    async def run(self, seconds: float) -> str:
+        self.running = True
+        try:
+            return await asyncio.to_thread(self.sample, seconds)
+        finally:
+            self.running = False
+
+profiler = SamplingProfiler(PROFILE_INTERVAL)
+
+def memory_report(top: int = 15) -> str:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    lines = [
+        "🧠 Xotira",
+        f"Eng yuqori RSS: {usage.ru_maxrss / 1024:.1f} MB",
+        f"GC obyektlari: {len(gc.get_objects())}",
+        "",
+        f"FSM hot: {len(fsm_storage._hot)} / {fsm_storage.hot_size}, dirty: {len(fsm_storage._dirty)}",
+        f"Usta keshi: {len(usta_cache._data)} / {usta_cache.maxsize}",
+        f"Throttle bucketlar: {len(throttle._buckets)} / {throttle.max_users}",
+        f"Update navbati: {update_executor.queued}, ishlayotgan: {update_executor.running}, "
+        f"foydalanuvchilar: {len(update_executor._users)}",
+        f"Chiquvchi navbat: {outbound.queued()}, per-chat: {len(outbound._chat_next)}",
+        f"Redispatch heap: {len(order_redispatcher._heap)} (faol {len(order_redispatcher._due)})",
+        f"DB writer navbati: {len(db_writer._queue)}",
+        f"asyncio vazifalar: {len(asyncio.all_tasks())}",
+    ]
+    if not tracemalloc.is_tracing():
+        lines += ["", "tracemalloc o‘chiq: /mem on - yoqish, /mem off - o‘chirish."]
+        return "\n".join(lines)
+    current, peak = tracemalloc.get_traced_memory()
+    lines += ["", f"tracemalloc: hozir {current / 2**20:.1f} MB, cho‘qqi {peak / 2**20:.1f} MB", "Eng ko‘p ajratganlar:"]
+    for stat in tracemalloc.take_snapshot().statistics("lineno")[:top]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size / 1024:9.1f} KB {stat.count:>7}  {Path(frame.filename).name}:{frame.lineno}")
+    return "\n".join(lines)
 
 # ----------------- UI -----------------
 def main_kb(is_admin: bool = False) -> ReplyKeyboardMarkup:
@@ -279,6 +1971,14 @@ def nav_kb() -> ReplyKeyboardMarkup:
         resize_keyboard=True
     )
 
+def categories_kb() -> InlineKeyboardMarkup:
+    return job_taxonomy.keyboard
+
+def callback_category(data: Optional[str]) -> Optional[int]:
+    # "job:<id>" -> id; buzilgan yoki notanish callback_data -> None
+    _, _, raw = (data or "").partition(":")
+    return int(raw) if raw.isdigit() and int(raw) in job_taxonomy.names else None
+
 def usta_kb() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
         keyboard=[
@@ -295,6 +1995,8 @@ def admin_kb() -> ReplyKeyboardMarkup:
         keyboard=[
             [KeyboardButton(text=BTN_ADMIN_USTALAR)],
             [KeyboardButton(text=BTN_ADMIN_BUYURTMALAR)],
+            [KeyboardButton(text=BTN_ADMIN_STATS)],
+            [KeyboardButton(text=BTN_ADMIN_BROADCAST)],
             [KeyboardButton(text=BTN_ADMIN_BLOCK)],
             [KeyboardButton(text=BTN_ADMIN_UNBLOCK)],
             [KeyboardButton(text=BTN_ADMIN_BACK)],
@@ -318,13 +2020,268 @@ class BuyurtmachiReg(StatesGroup):
 class AdminFlow(StatesGroup):
     block_id = State()
     unblock_id = State()
+    broadcast_text = State()
 
 # ----------------- HELPERS -----------------
 def is_admin(user_id: int) -> bool:
     return user_id in ADMIN_IDS
 
-async def send_order_to_ustalar(order_id: int, ish_turi: str, region: str, phone: str, comment: str, ustalar_rows: List[sqlite3.Row]):
-    # Ustalarga avtomatik yuborish (limit 10)
+# ----------------- PAGINATION -----------------
+# callback_data: "pg|<kind>|<n/p>|<kursor>"
+#   u  - ustalar ro'yxati (hamma uchun), kursor "updated_at~user_id"
+#   au - admin: ustalar, kursor "updated_at~user_id"
+#   ab - admin: buyurtmalar, kursor "id"
+PAGE_TITLES = {
+    "u": "📋 Ustalar ro‘yxati:",
+    "au": "📋 Admin: Ustalar",
+    "ab": "🧾 Admin: Buyurtmalar",
+}
+PAGE_EMPTY = {
+    "u": "📋 Hozircha ustalar ro‘yxati bo‘sh.",
+    "au": "Ustalar yo‘q.",
+    "ab": "Buyurtmalar yo‘q.",
+}
+
+def _page_line(kind: str, r: sqlite3.Row) -> str:
+    if kind == "ab":
+        return f"ID:{r['id']} | user:{r['user_id']} | {r['ish_turi']} | {r['region']} | {r['phone']} | {r['created_at']}"
+    active = "✅" if r["is_active"] == 1 else "⛔️"
+    line = f"{active} {r['status']} {r['name']} | {r['job']} | {r['region']} | {r['phone']}"
+    return f"{r['user_id']} | {line}" if kind == "au" else f"• {line}"
+
+def _page_cursor(kind: str, r: sqlite3.Row) -> str:
+    return str(r["id"]) if kind == "ab" else f"{r['updated_at']}~{r['user_id']}"
+
+def _parse_cursor(kind: str, raw: str) -> Any:
+    if kind == "ab":
+        return int(raw)
+    updated_at, user_id = raw.rsplit("~", 1)
+    return updated_at, int(user_id)
+
+async def load_page(kind: str, cursor: Any = None, direction: str = "next"):
+    if kind == "ab":
+        rows = await list_buyurtmalar_page(cursor, direction)
+    else:
+        rows = await list_ustalar_page(cursor, direction)
+    more = len(rows) > PAGE_SIZE
+    if direction == "next":
+        rows = rows[:PAGE_SIZE]
+        has_prev, has_next = cursor is not None, more
+    else:
+        rows = rows[-PAGE_SIZE:]
+        has_prev, has_next = more, True
+    return rows, has_prev, has_next
+
+def render_page(kind: str, rows: List[sqlite3.Row], has_prev: bool, has_next: bool):
+    text = PAGE_TITLES[kind] + "\n" + "\n".join(_page_line(kind, r) for r in rows)
+    if len(text) > TG_TEXT_LIMIT:
+        text = text[:TG_TEXT_LIMIT - 1] + "…"
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"pg|{kind}|p|{_page_cursor(kind, rows[0])}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"pg|{kind}|n|{_page_cursor(kind, rows[-1])}"))
+    kb = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return text, kb
+
+async def send_first_page(message: Message, kind: str, empty_kb: ReplyKeyboardMarkup):
+    rows, has_prev, has_next = await load_page(kind)
+    if not rows:
+        await message.answer(PAGE_EMPTY[kind], reply_markup=empty_kb)
+        return
+    text, kb = render_page(kind, rows, has_prev, has_next)
+    await message.answer(text, reply_markup=kb)
+
+# ----------------- RATE LIMIT -----------------
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self) -> None:
+        while not self.try_acquire():
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# Chiquvchi xabar navbati: qaysi "yo'lak"dan yuborilayotgani. Handler javoblari -
+# interactive (standart), buyurtmachi/ustaga xabarnoma - transactional, outbox va
+# tarqatma - bulk. Fon vazifalari kontekstni yaratilgan joydan meros oladi,
+# shuning uchun ular yo'lakni o'zi belgilaydi: with send_lane("bulk"): ...
+SEND_LANE: ContextVar[str] = ContextVar("send_lane", default="interactive")
+LANE_PRIORITY = {"interactive": 0, "transactional": 1, "bulk": 2}
+# Telegram limitiga kiradigan chaqiruvlar (answerCallbackQuery, getUpdates ... emas)
+SCHEDULED_METHODS = ("Send", "Edit", "Copy", "Forward")
+
+@contextmanager
+def send_lane(lane: str):
+    token = SEND_LANE.set(lane)
+    try:
+        yield
+    finally:
+        SEND_LANE.reset(token)
+
+OUTBOUND_WAIT = MetricHistogram("bot_outbound_wait_seconds", "Time outbound calls wait for a send slot", ("lane",))
+
+class OutboundScheduler(BaseRequestMiddleware):
+    # Bot sessiyasidagi barcha xabar yuborish/tahrirlash shu yerdan o'tadi:
+    # umumiy token bucket (SEND_RATE) navbatda turganlarga yo'lak ustuvorligi bo'yicha
+    # beriladi (bir yo'lak ichida FIFO). Per-chat oraliq (SEND_CHAT_INTERVAL) faqat
+    # interactive bo'lmagan yo'laklarga: foydalanuvchining o'z harakatiga javob kutmaydi.
+    def __init__(self, rate: float, chat_interval: float):
+        self.bucket = TokenBucket(rate, rate)
+        self.chat_interval = chat_interval
+        self.priority = dict(LANE_PRIORITY)
+        self._chat_next: Dict[int, float] = {}
+        self._paused_until = 0.0
+        self._heap: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def __call__(self, make_request, bot, method):
+        if not type(method).__name__.startswith(SCHEDULED_METHODS):
+            return await make_request(bot, method)
+        lane = SEND_LANE.get()
+        started = time.perf_counter()
+        chat_id = getattr(method, "chat_id", None)
+        if lane != "interactive" and isinstance(chat_id, int):
+            await self._chat_slot(chat_id)
+        await self._grant(lane)
+        OUTBOUND_WAIT.observe(time.perf_counter() - started, lane)
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            self.pause(e.retry_after)
+            raise
+
+    def set_rate(self, rate: float) -> None:
+        # worker rejimi: har jarayon Telegramning bot bo'yicha limitidan o'z ulushini oladi
+        self.bucket.rate = self.bucket.capacity = rate
+        self.bucket.tokens = min(self.bucket.tokens, rate)
+
+    def pause(self, seconds: float) -> None:
+        # 429: faqat shu chaqiruv emas, butun navbat (hamma yo'laklar) retry_after
+        # davomida to'xtaydi; bucket bo'shatiladi - pauzadan keyin portlash bo'lmasin
+        until = time.monotonic() + seconds
+        if until > self._paused_until:
+            log.warning("outbound: flood limit, pausing all sends for %ss", seconds)
+            self._paused_until = until
+        self.bucket.tokens = 0
+
+    async def _chat_slot(self, chat_id: int) -> None:
+        now = time.monotonic()
+        slot = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = slot + self.chat_interval
+        if len(self._chat_next) > 10000:
+            self._chat_next = {k: v for k, v in self._chat_next.items() if v > now}
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _grant(self, lane: str) -> None:
+        if not self._heap and time.monotonic() >= self._paused_until and self.bucket.try_acquire():
+            return
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        fut = loop.create_future()
+        heapq.heappush(self._heap, (self.priority[lane], next(self._seq), fut))
+        self._wakeup.set()
+        await fut
+
+    async def _run(self) -> None:
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            await self.bucket.acquire()
+            _, _, fut = heapq.heappop(self._heap)
+            if fut.done():  # kutgan chaqiruv bekor qilingan: token qaytadi
+                self.bucket.tokens += 1
+            else:
+                fut.set_result(None)
+
+    def queued(self) -> int:
+        return len(self._heap)
+
+outbound = OutboundScheduler(SEND_RATE, SEND_CHAT_INTERVAL)
+# tashqi: navbat, ichki: metrikalar (faqat Bot API vaqti)
+bot.session.middleware(outbound)
+bot.session.middleware(OutboundMetricsMiddleware())
+MetricGauge("bot_outbound_queued", "Outbound calls waiting for a send slot", outbound.queued)
+
+THROTTLED = MetricCounter("bot_throttled_updates_total", "Updates dropped by the per-user rate limit", ("class",))
+
+class ThrottleMiddleware(BaseMiddleware):
+    # (user_id, sinf) -> TokenBucket, LRU bilan cheklangan. Sinf handler flagidan:
+    # @dp.message(..., flags={"throttle": "read"}). Limitga tushganda bitta ogohlantirish,
+    # keyingilari jimgina tashlanadi (token qaytguncha).
+    def __init__(self, limits: Dict[str, Tuple[float, float]], max_users: int):
+        self.limits = limits
+        self.max_users = max_users
+        self._buckets: "OrderedDict[Tuple[int, str], TokenBucket]" = OrderedDict()
+        self._noticed: set = set()
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+        cls = get_flag(data, "throttle", default="default")
+        key = (user.id, cls)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(*self.limits[cls])
+            if len(self._buckets) > self.max_users:
+                old, _ = self._buckets.popitem(last=False)
+                self._noticed.discard(old)
+        else:
+            self._buckets.move_to_end(key)
+
+        if bucket.try_acquire():
+            self._noticed.discard(key)
+            return await handler(event, data)
+
+        THROTTLED.inc(cls)
+        if key not in self._noticed:
+            self._noticed.add(key)
+            # Message.answer -> xabar, CallbackQuery.answer -> toast
+            await event.answer("⏳ Juda tez! Biroz kutib, qayta urinib ko‘ring.")
+        return None
+
+throttle = ThrottleMiddleware(THROTTLE_LIMITS, THROTTLE_USERS)
+dp.message.middleware(throttle)
+dp.callback_query.middleware(throttle)
+
+async def send_limited(chat_id: int, text: str, **kwargs) -> Message:
+    # navbat/limit OutboundScheduler da (yo'lak chaqiruvchidan; RetryAfter da u butun
+    # navbatni to'xtatadi). Bu chaqiruv kutib qayta yuboriladi; Forbidden yuqoriga chiqadi
+    for attempt in range(SEND_RETRIES + 1):
+        try:
+            return await bot.send_message(chat_id, text, **kwargs)
+        except TelegramRetryAfter as e:
+            if attempt == SEND_RETRIES:
+                raise
+            await asyncio.sleep(e.retry_after)
+
+def order_offer(order_id: int, ish_turi: str, region: str, phone: str, comment: str):
     text = (
         "🆕 Yangi buyurtma!\n\n"
         f"ID: {order_id}\n"
@@ -340,15 +2297,350 @@ async def send_order_to_ustalar(order_id: int, ish_turi: str, region: str, phone
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="✅ Qabul qildim", callback_data=f"accept:{order_id}")]
     ])
+    return text, kb
+
+async def withdraw_offers(order: sqlite3.Row, others: List[sqlite3.Row]) -> None:
+    # boshqa ustalardagi taklifni "band" ga aylantiramiz (tugmasiz), parallel
+    text, _ = order_offer(order["id"], order["ish_turi"], order["region"], order["phone"], order["comment"])
+    text = text.rsplit("\n\n", 1)[0] + "\n\n⛔ Bu buyurtmani boshqa usta qabul qildi."
+
+    async def edit(r: sqlite3.Row) -> None:
+        with send_lane("transactional"):
+            await bot.edit_message_text(text, chat_id=int(r["usta_id"]), message_id=int(r["message_id"]))
+
+    results = await asyncio.gather(*(edit(r) for r in others), return_exceptions=True)
+    for r, res in zip(others, results):
+        if isinstance(res, Exception):
+            log.debug("order %s: withdraw from %s failed: %r", order["id"], r["usta_id"], res)
+
+DELIVERIES = MetricCounter("bot_order_deliveries_total", "Order notifications by outcome", ("status",))
+
+class DeliveryDispatcher:
+    # order_deliveries dagi 'pending' yozuvlarni yuboradi. Yangi buyurtmada wake()
+    # bilan uyg'onadi; qayta urinishlar next_at bo'yicha kutiladi (polling yo'q).
+    # Jarayon o'lib qolsa, 'pending' lar startupda davom ettiriladi.
+    # Worker rejimida har worker faqat o'z ustalariga (usta_id % WORKER_COUNT) yuboradi.
+    def __init__(self):
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def wake(self, publish: bool = True) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        self._wakeup.set()
+        if publish:
+            cluster.publish("wake")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        if self._task is None or self._task.done():
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            self._wakeup.clear()
+            try:
+                rows = await run_db(pending_deliveries_sync, time.time())
+                if rows:
+                    await self._deliver(rows)
+                    continue
+                next_at = await run_db(next_delivery_at_sync)
+            except Exception:
+                log.exception("delivery dispatcher failed")
+                next_at = time.time() + DELIVERY_RETRY_DELAY
+            timeout = None if next_at is None else max(0.0, next_at - time.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver(self, rows: List[sqlite3.Row]) -> None:
+        to_send = [r for r in rows if r["order_status"] == "new"]
+        results = [("skipped", None, None, 0, r["id"]) for r in rows if r["order_status"] != "new"]
+        sent = await asyncio.gather(*(self._send(r) for r in to_send), return_exceptions=True)
+        blocked = []
+        for r, res in zip(to_send, sent):
+            if isinstance(res, Message):
+                results.append(("sent", res.message_id, None, 0, r["id"]))
+            elif isinstance(res, TelegramForbiddenError):
+                results.append(("blocked", None, str(res), 0, r["id"]))
+                blocked.append(int(r["usta_id"]))
+            else:
+                log.warning("order %s: send to %s failed: %r", r["order_id"], r["usta_id"], res)
+                retry = r["attempts"] + 1 < DELIVERY_MAX_ATTEMPTS
+                next_at = time.time() + DELIVERY_RETRY_DELAY * (r["attempts"] + 1)
+                results.append(("pending" if retry else "failed", None, repr(res), next_at, r["id"]))
+        await db_write(finish_deliveries_tx, results)
+        for status, *_ in results:
+            DELIVERIES.inc(status)
+        for uid in blocked:
+            # botni bloklagan usta: nofaol qilamiz, keyingi buyurtmalarga tushmaydi
+            log.info("usta %s blocked the bot, marking inactive", uid)
+            await set_usta_active(uid, 0)
+
+    async def _send(self, r: sqlite3.Row) -> Message:
+        text, kb = order_offer(r["order_id"], r["ish_turi"], r["region"], r["phone"], r["comment"])
+        with send_lane("bulk"):
+            return await send_limited(int(r["usta_id"]), text, reply_markup=kb)
+
+delivery_dispatcher = DeliveryDispatcher()
+
+class OrderRedispatcher:
+    # Qabul qilinmagan buyurtmalar uchun xotiradagi taymer heap: (vaqt, order_id).
+    # Bo'sh turganda DB so'ralmaydi; startupda heap DB dan tiklanadi
+    # (worker rejimida faqat shu workerga tushadigan buyurtmachilarniki).
+    # _due: eskirgan heap yozuvlarini tashlab ketish uchun (lazy deletion).
+    def __init__(self):
+        self._heap: List[Tuple[float, int]] = []
+        self._due: Dict[int, float] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.waves = 0
+
+    def schedule(self, order_id: int, due: float) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        self._due[order_id] = due
+        heapq.heappush(self._heap, (due, order_id))
+        if self._heap[0] == (due, order_id):
+            self._wakeup.set()
+
+    def cancel(self, order_id: int) -> None:
+        self._due.pop(order_id, None)
+
+    async def load(self) -> None:
+        for r in await run_db(scheduled_orders_sync):
+            self.schedule(int(r["id"]), float(r["next_wave_at"]))
+
+    async def stop(self) -> None:
+        if self._task is None or self._task.done():
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            self._wakeup.clear()
+            now = time.time()
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                at, order_id = heapq.heappop(self._heap)
+                if self._due.get(order_id) == at:
+                    del self._due[order_id]
+                    due.append(order_id)
+            if due:
+                await self._fire(due, now)
+                continue
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, order_ids: List[int], now: float) -> None:
+        results = await asyncio.gather(*(db_write(redispatch_order_tx, oid, now) for oid in order_ids),
+                                       return_exceptions=True)
+        sent = False
+        for order_id, res in zip(order_ids, results):
+            if isinstance(res, Exception):
+                log.warning("order %s: redispatch failed: %r", order_id, res)
+                self.schedule(order_id, now + REDISPATCH_TIMEOUT)
+                continue
+            usta_ids, next_at = res
+            if usta_ids:
+                self.waves += 1
+                sent = True
+                log.info("order %s: next wave to %d masters", order_id, len(usta_ids))
+            if next_at is not None:
+                self.schedule(order_id, next_at)
+        if sent:
+            delivery_dispatcher.wake()
+
+order_redispatcher = OrderRedispatcher()
+
+MetricGauge("bot_redispatch_scheduled", "Unaccepted orders waiting for the next wave",
+            lambda: len(order_redispatcher._due))
+MetricGauge("bot_redispatch_waves_total", "Order waves sent to additional masters",
+            lambda: order_redispatcher.waves, "counter")
+
+ARCHIVED = MetricCounter("bot_archived_orders_total", "Orders moved to monthly archive files")
+
+class OrderArchiver:
+    # Har ARCHIVE_INTERVAL da eski yakunlangan buyurtmalarni bo'lak-bo'lak arxivga
+    # ko'chiradi; bo'laklar orasida writer boshqa yozuvlarni ham bajarib oladi.
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if ARCHIVE_AGE_DAYS > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run_once(self) -> int:
+        # chegara bir marta; har bo'lak oldingisidan keyingi id dan, qisqa bo'lak - oxirgisi
+        total = 0
+        upto = await run_db(archive_cutoff_sync, ARCHIVE_AGE_DAYS)
+        after = 0
+        while upto is not None:
+            groups = await run_db(archive_copy_sync, ARCHIVE_AGE_DAYS, after, upto)
+            if not groups:
+                break
+            deleted, stale = await db_write(archive_commit_tx, groups)
+            if stale:
+                await run_db(archive_discard_sync, stale)
+            total += deleted
+            ids = [order_id for _, pairs in groups for order_id, _ in pairs]
+            if len(ids) < ARCHIVE_BATCH:
+                break
+            after = max(ids)
+            await asyncio.sleep(0.05)
+        if total:
+            ARCHIVED.inc(amount=total)
+            log.info("archive: moved %d orders older than %g days", total, ARCHIVE_AGE_DAYS)
+        return total
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                log.exception("archive: run failed")
+            await asyncio.sleep(ARCHIVE_INTERVAL)
+
+order_archiver = OrderArchiver()
+
+BROADCAST_SENT = MetricCounter("bot_broadcast_messages_total", "Admin broadcast messages by outcome", ("status",))
+
+def broadcast_progress(b: sqlite3.Row) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    title = {"running": "📣 Tarqatilmoqda...", "done": "✅ Tarqatma tugadi",
+             "cancelled": "⏹ Tarqatma to‘xtatildi"}[b["status"]]
+    text = (
+        f"{title} (#{b['id']})\n\n"
+        f"Yuborildi: {b['sent']}\n"
+        f"Xato: {b['failed']}\n"
+        f"Qoldi: {max(0, b['total'] - b['sent'] - b['failed']) if b['status'] == 'running' else 0}"
+    )
+    if b["status"] != "running":
+        return text, None
+    return text, InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⏹ To‘xtatish", callback_data=f"bcast_stop:{b['id']}")]
+    ])
 
-    for u in ustalar_rows[:10]:
+class Broadcaster:
+    # broadcasts dagi 'running' tarqatmani bo'lak-bo'lak yuboradi: qabul qiluvchilar
+    # ustalar PK bo'yicha keyset (xotirada faqat bitta bo'lak), har bo'lakdan keyin
+    # cursor va hisoblagichlar saqlanadi - restartda shu joydan davom etadi
+    # (uzilgan bo'lak qayta yuborilishi mumkin). Worker rejimida faqat 0-worker yuradi.
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    def wake(self, publish: bool = True) -> None:
+        if publish:
+            cluster.publish("broadcast")
+        if WORKER_INDEX != 0:
+            return
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        while True:
+            b = await run_db(running_broadcast_sync)
+            if b is None:
+                return
+            try:
+                await self._broadcast(b)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("broadcast %s failed, retrying", b["id"])
+                await asyncio.sleep(DELIVERY_RETRY_DELAY)
+
+    async def _broadcast(self, b: sqlite3.Row) -> None:
+        edited = time.monotonic()
+        while b["status"] == "running":
+            ids = await run_db(broadcast_recipients_sync, b["cursor"])
+            with send_lane("bulk"):
+                results = await asyncio.gather(*(send_limited(uid, b["text"]) for uid in ids), return_exceptions=True)
+            sent = failed = 0
+            for uid, res in zip(ids, results):
+                if isinstance(res, Message):
+                    sent += 1
+                    continue
+                failed += 1
+                if isinstance(res, TelegramForbiddenError):
+                    await set_usta_active(uid, 0)
+                else:
+                    log.warning("broadcast %s: send to %s failed: %r", b["id"], uid, res)
+            BROADCAST_SENT.inc("sent", amount=sent)
+            BROADCAST_SENT.inc("failed", amount=failed)
+            row = await db_write(broadcast_progress_tx, b["id"], ids[-1] if ids else None, sent, failed)
+            if row is None:  # admin to'xtatdi
+                row = await run_db(get_broadcast_sync, b["id"])
+            b = row
+            if b["status"] != "running" or time.monotonic() - edited >= BROADCAST_EDIT_INTERVAL:
+                edited = time.monotonic()
+                await self._edit_progress(b)
+        log.info("broadcast %s %s: sent=%s failed=%s", b["id"], b["status"], b["sent"], b["failed"])
+
+    async def _edit_progress(self, b: sqlite3.Row) -> None:
+        if not b["chat_id"]:
+            return
+        text, kb = broadcast_progress(b)
         try:
-            await bot.send_message(u["user_id"], text, reply_markup=kb)
-        except Exception:
-            pass
+            await bot.edit_message_text(text, chat_id=b["chat_id"], message_id=b["message_id"], reply_markup=kb)
+        except TelegramAPIError as e:
+            log.debug("broadcast %s: progress edit failed: %r", b["id"], e)
+
+broadcaster = Broadcaster()
+
+@dp.startup()
+async def on_startup_deliveries():
+    # tugallanmagan yetkazishlarni va to'lqin taymerlarini davom ettiramiz
+    delivery_dispatcher.wake(publish=False)
+    await order_redispatcher.load()
+    if WORKER_INDEX == 0:  # arxiv va tarqatmani bitta jarayon yuritadi
+        order_archiver.start()
+        broadcaster.wake(publish=False)
+
+@dp.shutdown()
+async def on_shutdown_deliveries():
+    await broadcaster.stop()
+    await order_archiver.stop()
+    await order_redispatcher.stop()
+    await delivery_dispatcher.stop()
 
 # ✅ CALLBACK: usta "Qabul qildim" bosganda
-@dp.callback_query(F.data.startswith("accept:"))
+@dp.callback_query(F.data.startswith("accept:"), flags={"throttle": "write"})
 async def accept_callback(cb: CallbackQuery, state: FSMContext):
     try:
         order_id = int(cb.data.split(":")[1])
@@ -358,21 +2650,14 @@ async def accept_callback(cb: CallbackQuery, state: FSMContext):
 
     usta_id = cb.from_user.id
 
-    # usta ro'yxatdan o'tganmi
-    usta = await get_usta(usta_id)
+    usta, order, others = await accept_order(order_id, usta_id)
     if not usta:
         await cb.answer("Avval usta sifatida ro'yxatdan o'ting.", show_alert=True)
         return
-
-    ok = await accept_buyurtma(order_id, usta_id)
-    if not ok:
-        await cb.answer("Bu buyurtma allaqachon qabul qilingan.", show_alert=True)
-        return
-
-    order = await get_buyurtma(order_id)
     if not order:
-        await cb.answer("Buyurtma topilmadi.", show_alert=True)
+        await cb.answer("Bu buyurtma allaqachon qabul qilingan.", show_alert=True)
         return
+    order_redispatcher.cancel(order_id)
 
     buyer_id = int(order["user_id"])
 
@@ -385,17 +2670,29 @@ async def accept_callback(cb: CallbackQuery, state: FSMContext):
         f"Kasb: {usta['job']}\n"
         f"Hudud: {usta['region']}\n"
     )
-    try:
-        await bot.send_message(buyer_id, msg_buyer)
-    except Exception:
-        pass
-
-    # Ustaga tasdiq
+    # Ustaga tasdiq darhol, qolgani parallel
     await cb.answer("Qabul qilindi ✅")
-    try:
-        await cb.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
+
+    async def notify_buyer() -> None:
+        with send_lane("transactional"):
+            await bot.send_message(buyer_id, msg_buyer)
+
+    buyer_res, edit_res, withdraw_res = await asyncio.gather(
+        notify_buyer(),
+        bot(cb.message.edit_reply_markup(reply_markup=None)),
+        withdraw_offers(order, others),
+        return_exceptions=True,
+    )
+    if isinstance(edit_res, Exception):
+        log.debug("order %s: offer markup edit failed: %r", order_id, edit_res)
+    if isinstance(withdraw_res, Exception):
+        log.warning("order %s: withdrawing offers failed: %r", order_id, withdraw_res)
+    if isinstance(buyer_res, Exception):
+        # buyurtmachi qabul haqida bilmaydi - usta o'zi bog'lansin
+        log.warning("order %s: buyer %s not notified of acceptance: %r", order_id, buyer_id, buyer_res)
+        await cb.message.answer(f"✅ Siz buyurtmani qabul qildingiz. (ID: {order_id})\n"
+                                f"⚠️ Buyurtmachiga xabar yetmadi, o‘zingiz qo‘ng‘iroq qiling: {order['phone']}")
+        return
     await cb.message.answer(f"✅ Siz buyurtmani qabul qildingiz. (ID: {order_id})")
 
 # ----------------- BASIC COMMANDS -----------------
@@ -403,6 +2700,49 @@ async def accept_callback(cb: CallbackQuery, state: FSMContext):
 async def myid(message: Message):
     await message.answer(f"Sizning ID: {message.from_user.id}")
 
+@dp.message(Command("cache"), flags={"throttle": "admin"})
+async def cache_stats(message: Message):
+    if not is_admin(message.from_user.id):
+        return
+    st = usta_cache.stats()
+    await message.answer(
+        "🗂 Usta keshi:\n\n"
+        f"Hajm: {st['size']} / {st['maxsize']}\n"
+        f"Hit: {st['hits']}\n"
+        f"Miss: {st['misses']}\n"
+        f"Evict: {st['evictions']}\n"
+        f"Hit rate: {st['hit_rate']}"
+    )
+
+@dp.message(Command("profile"), flags={"throttle": "admin"})
+async def profile_cmd(message: Message):
+    if not is_admin(message.from_user.id):
+        return
+    if profiler.running:
+        await message.answer("⏳ Profil allaqachon olinmoqda.")
+        return
+    parts = (message.text or "").split()
+    try:
+        seconds = min(max(float(parts[1]), 0.1), PROFILE_MAX_SECONDS) if len(parts) > 1 else 10.0
+    except ValueError:
+        await message.answer(f"Foydalanish: /profile [sekund, {PROFILE_MAX_SECONDS} gacha]")
+        return
+    await message.answer(f"⏱ {seconds:g} s profil olinmoqda...")
+    report = await profiler.run(seconds)
+    name = f"profile-{datetime.now():%Y%m%d-%H%M%S}-w{WORKER_INDEX}.txt"
+    await message.answer_document(BufferedInputFile(report.encode(), filename=name))
+
+@dp.message(Command("mem"), flags={"throttle": "admin"})
+async def mem_cmd(message: Message):
+    if not is_admin(message.from_user.id):
+        return
+    arg = ((message.text or "").split() + [""])[1]
+    if arg == "on" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif arg == "off" and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    await message.answer(memory_report()[:TG_TEXT_LIMIT])
+
 @dp.message(Command("start"))
 async def start_handler(message: Message, state: FSMContext):
     await state.clear()
@@ -424,18 +2764,33 @@ async def back_any(message: Message, state: FSMContext):
     await message.answer("⬅️ Asosiy menyu:", reply_markup=main_kb(is_admin=is_admin(message.from_user.id)))
 
 # ----------------- LIST USTALAR -----------------
-@dp.message(F.text == BTN_LIST)
+@dp.message(F.text == BTN_LIST, flags={"throttle": "read"})
 async def ustalar_list(message: Message, state: FSMContext):
     await state.clear()
-    rows = await list_ustalar(30)
+    await send_first_page(message, "u", main_kb(is_admin=is_admin(message.from_user.id)))
+
+# ⬅️/➡️: sahifani yangi xabar emas, o'sha xabarni tahrirlab ko'rsatamiz
+@dp.callback_query(F.data.startswith("pg|"), flags={"throttle": "read"})
+async def page_callback(cb: CallbackQuery):
+    try:
+        _, kind, direction, raw = cb.data.split("|", 3)
+        cursor = _parse_cursor(kind, raw)
+    except (ValueError, KeyError):
+        await cb.answer("Xato sahifa", show_alert=True)
+        return
+    if kind not in PAGE_TITLES or (kind != "u" and not is_admin(cb.from_user.id)):
+        await cb.answer()
+        return
+    rows, has_prev, has_next = await load_page(kind, cursor, "prev" if direction == "p" else "next")
     if not rows:
-        await message.answer("📋 Hozircha ustalar ro‘yxati bo‘sh.", reply_markup=main_kb(is_admin=is_admin(message.from_user.id)))
+        await cb.answer("Boshqa sahifa yo‘q.")
         return
-    text = "📋 Ustalar ro‘yxati:\n"
-    for r in rows:
-        active = "✅" if r["is_active"] == 1 else "⛔️"
-        text += f"• {active} {r['status']} {r['name']} | {r['job']} | {r['region']} | {r['phone']}\n"
-    await message.answer(text, reply_markup=main_kb(is_admin=is_admin(message.from_user.id)))
+    text, kb = render_page(kind, rows, has_prev, has_next)
+    try:
+        await cb.message.edit_text(text, reply_markup=kb)
+    except Exception:
+        pass
+    await cb.answer()
 
 # ----------------- USTA CABINET -----------------
 @dp.message(F.text == BTN_USTA)
@@ -449,7 +2804,7 @@ async def usta_entry(message: Message, state: FSMContext):
         await state.set_state(UstaReg.name)
         await message.answer("🧑‍🔧 Usta ro‘yxatdan o‘tish.\nIsmingizni yuboring:", reply_markup=nav_kb())
 
-@dp.message(F.text == BTN_MY_PROFILE)
+@dp.message(F.text == BTN_MY_PROFILE, flags={"throttle": "read"})
 async def usta_profile(message: Message, state: FSMContext):
     await state.clear()
     uid = message.from_user.id
@@ -474,44 +2829,52 @@ async def usta_edit(message: Message, state: FSMContext):
     await state.set_state(UstaReg.name)
     await message.answer("✏️ Profilni tahrirlash.\nYangi ismingizni yuboring:", reply_markup=nav_kb())
 
-@dp.message(F.text == BTN_FREE)
+@dp.message(F.text == BTN_FREE, flags={"throttle": "write"})
 async def usta_free(message: Message, state: FSMContext):
     await state.clear()
     uid = message.from_user.id
-    if not await get_usta(uid):
+    usta = await get_usta(uid)
+    if not usta:
         await message.answer("Avval ro‘yxatdan o‘ting: 🧑‍🔧 Men ustaman", reply_markup=main_kb(is_admin=is_admin(uid)))
         return
-    await set_usta_status(uid, "🟢 Bo‘shman")
+    if usta["status"] != "🟢 Bo‘shman":  # takroriy bosish: yozuvsiz
+        await set_usta_status(uid, "🟢 Bo‘shman")
     await message.answer("Holat yangilandi: 🟢 Bo‘shman", reply_markup=usta_kb())
 
-@dp.message(F.text == BTN_BUSY)
+@dp.message(F.text == BTN_BUSY, flags={"throttle": "write"})
 async def usta_busy(message: Message, state: FSMContext):
     await state.clear()
     uid = message.from_user.id
-    if not await get_usta(uid):
+    usta = await get_usta(uid)
+    if not usta:
         await message.answer("Avval ro‘yxatdan o‘ting: 🧑‍🔧 Men ustaman", reply_markup=main_kb(is_admin=is_admin(uid)))
         return
-    await set_usta_status(uid, "🔴 Bandman")
+    if usta["status"] != "🔴 Bandman":  # takroriy bosish: yozuvsiz
+        await set_usta_status(uid, "🔴 Bandman")
     await message.answer("Holat yangilandi: 🔴 Bandman", reply_markup=usta_kb())
 
-@dp.message(F.text == BTN_ACTIVE)
+@dp.message(F.text == BTN_ACTIVE, flags={"throttle": "write"})
 async def usta_active(message: Message, state: FSMContext):
     await state.clear()
     uid = message.from_user.id
-    if not await get_usta(uid):
+    usta = await get_usta(uid)
+    if not usta:
         await message.answer("Avval ro‘yxatdan o‘ting: 🧑‍🔧 Men ustaman", reply_markup=main_kb(is_admin=is_admin(uid)))
         return
-    await set_usta_active(uid, 1)
+    if usta["is_active"] != 1:  # takroriy bosish: yozuvsiz
+        await set_usta_active(uid, 1)
     await message.answer("✅ Endi siz FAOLsiz (buyurtmalar keladi).", reply_markup=usta_kb())
 
-@dp.message(F.text == BTN_INACTIVE)
+@dp.message(F.text == BTN_INACTIVE, flags={"throttle": "write"})
 async def usta_inactive(message: Message, state: FSMContext):
     await state.clear()
     uid = message.from_user.id
-    if not await get_usta(uid):
+    usta = await get_usta(uid)
+    if not usta:
         await message.answer("Avval ro‘yxatdan o‘ting: 🧑‍🔧 Men ustaman", reply_markup=main_kb(is_admin=is_admin(uid)))
         return
-    await set_usta_active(uid, 0)
+    if usta["is_active"] != 0:  # takroriy bosish: yozuvsiz
+        await set_usta_active(uid, 0)
     await message.answer("⛔️ Endi siz NOFAOLsiz (buyurtma kelmaydi).", reply_markup=usta_kb())
 
 # ----------------- USTA REG FLOW -----------------
@@ -537,21 +2900,38 @@ async def usta_phone(message: Message, state: FSMContext):
         return
     await state.update_data(phone=phone)
     await state.set_state(UstaReg.job)
-    await message.answer("🛠 Kasbingiz (Elektrik / Santexnik / Payvandchi ...):", reply_markup=nav_kb())
+    await message.answer("🛠 Kasbingizni tanlang yoki yozing (bir nechta bo‘lsa vergul bilan):",
+                         reply_markup=categories_kb())
+
+async def usta_job_chosen(message: Message, state: FSMContext, job: str):
+    await state.update_data(job=job)
+    await state.set_state(UstaReg.region)
+    await message.answer(f"🛠 Kasb: {job}\n📍 Hudud (masalan: Andijon, Asaka):", reply_markup=nav_kb())
 
 @dp.message(UstaReg.job)
 async def usta_job(message: Message, state: FSMContext):
     if message.text in (BTN_BACK, BTN_CANCEL):
         return
-    job = (message.text or "").strip()
-    if len(job) < 3:
-        await message.answer("Kasb juda qisqa. Qayta yozing:", reply_markup=nav_kb())
+    categories = job_taxonomy.resolve(message.text or "")
+    if not categories:
+        await message.answer("Bunday kasb topilmadi. Ro‘yxatdan tanlang:", reply_markup=categories_kb())
         return
-    await state.update_data(job=job)
-    await state.set_state(UstaReg.region)
-    await message.answer("📍 Hudud (masalan: Andijon, Asaka):", reply_markup=nav_kb())
+    await usta_job_chosen(message, state, job_taxonomy.label(categories))
 
-@dp.message(UstaReg.region)
+@dp.callback_query(UstaReg.job, F.data.startswith("job:"))
+async def usta_job_callback(cb: CallbackQuery, state: FSMContext):
+    category_id = callback_category(cb.data)
+    if category_id is None:
+        await cb.answer("Xato kategoriya", show_alert=True)
+        return
+    await cb.answer()
+    try:
+        await bot(cb.message.edit_reply_markup(reply_markup=None))
+    except Exception:
+        pass
+    await usta_job_chosen(cb.message, state, job_taxonomy.label([category_id]))
+
+@dp.message(UstaReg.region, flags={"throttle": "write"})
 async def usta_region(message: Message, state: FSMContext):
     if message.text in (BTN_BACK, BTN_CANCEL):
         return
@@ -579,19 +2959,37 @@ async def usta_region(message: Message, state: FSMContext):
 @dp.message(F.text == BTN_BUYURT)
 async def buyurt_start(message: Message, state: FSMContext):
     await state.set_state(BuyurtmachiReg.ish_turi)
-    await message.answer("🏠 Buyurtma qoldirish.\nQanday usta kerak? (Elektrik / Santexnik):", reply_markup=nav_kb())
+    await message.answer("🏠 Buyurtma qoldirish.", reply_markup=nav_kb())
+    await message.answer("Qanday usta kerak? Tanlang yoki yozing:", reply_markup=categories_kb())
+
+async def buyurt_ish_turi_chosen(message: Message, state: FSMContext, ish: str):
+    await state.update_data(ish_turi=ish)
+    await state.set_state(BuyurtmachiReg.region)
+    await message.answer(f"🛠 Kerak: {ish}\n📍 Hududingiz (masalan: Shahrixon):", reply_markup=nav_kb())
 
 @dp.message(BuyurtmachiReg.ish_turi)
 async def buyurt_ish_turi(message: Message, state: FSMContext):
     if message.text in (BTN_BACK, BTN_CANCEL):
         return
-    ish = (message.text or "").strip()
-    if len(ish) < 3:
-        await message.answer("Ish turi juda qisqa. Qayta yozing:", reply_markup=nav_kb())
+    categories = job_taxonomy.resolve(message.text or "")
+    if not categories:
+        await message.answer("Bunday ish turi topilmadi. Ro‘yxatdan tanlang:", reply_markup=categories_kb())
         return
-    await state.update_data(ish_turi=ish)
-    await state.set_state(BuyurtmachiReg.region)
-    await message.answer("📍 Hududingiz (masalan: Shahrixon):", reply_markup=nav_kb())
+    # buyurtma bitta kasbga: birinchi topilgani
+    await buyurt_ish_turi_chosen(message, state, job_taxonomy.label(categories[:1]))
+
+@dp.callback_query(BuyurtmachiReg.ish_turi, F.data.startswith("job:"))
+async def buyurt_ish_turi_callback(cb: CallbackQuery, state: FSMContext):
+    category_id = callback_category(cb.data)
+    if category_id is None:
+        await cb.answer("Xato kategoriya", show_alert=True)
+        return
+    await cb.answer()
+    try:
+        await bot(cb.message.edit_reply_markup(reply_markup=None))
+    except Exception:
+        pass
+    await buyurt_ish_turi_chosen(cb.message, state, job_taxonomy.label([category_id]))
 
 @dp.message(BuyurtmachiReg.region)
 async def buyurt_region(message: Message, state: FSMContext):
@@ -617,7 +3015,7 @@ async def buyurt_phone(message: Message, state: FSMContext):
     await state.set_state(BuyurtmachiReg.comment)
     await message.answer("📝 Izoh (ixtiyoriy). Yo‘q bo‘lsa `-` yuboring:", reply_markup=nav_kb())
 
-@dp.message(BuyurtmachiReg.comment)
+@dp.message(BuyurtmachiReg.comment, flags={"throttle": "write"})
 async def buyurt_finish(message: Message, state: FSMContext):
     if message.text in (BTN_BACK, BTN_CANCEL):
         return
@@ -628,8 +3026,13 @@ async def buyurt_finish(message: Message, state: FSMContext):
     data = await state.get_data()
     uid = message.from_user.id
 
-    order_id = await insert_buyurtma(uid, data["ish_turi"], data["region"], data["phone"], comment)
-    moslar = await find_matching_ustalar(data["ish_turi"], data["region"], 10)
+    moslar = await find_matching_ustalar(data["ish_turi"], data["region"], WAVE_SIZE)
+    # hech kim qabul qilmasa, REDISPATCH_TIMEOUT dan keyin keyingi to'lqin
+    next_wave_at = time.time() + REDISPATCH_TIMEOUT if REDISPATCH_MAX_WAVES > 0 else None
+    order_id = await insert_buyurtma(uid, data["ish_turi"], data["region"], data["phone"], comment,
+                                     [int(u["user_id"]) for u in moslar], next_wave_at)
+    if next_wave_at is not None:
+        order_redispatcher.schedule(order_id, next_wave_at)
 
     msg = (
         f"✅ Buyurtma qabul qilindi! (ID: {order_id})\n\n"
@@ -645,7 +3048,8 @@ async def buyurt_finish(message: Message, state: FSMContext):
         for u in moslar:
             msg += f"• {u['status']} {u['name']} | {u['job']} | {u['region']} | {u['phone']}\n"
         msg += "\n✅ Buyurtma mos ustalarga ham yuborildi (Qabul qildim tugmasi bilan)."
-        await send_order_to_ustalar(order_id, data["ish_turi"], data["region"], data["phone"], comment, moslar)
+        # yuborish fonda (outbox), buyurtmachi javobni kutib o'tirmaydi
+        delivery_dispatcher.wake()
     else:
         msg += "\nHozircha mos usta topilmadi. Ish turi yoki hududni aniqroq yozib ko‘ring."
 
@@ -667,33 +3071,120 @@ async def admin_back(message: Message, state: FSMContext):
     await state.clear()
     await message.answer("Asosiy menyu:", reply_markup=main_kb(is_admin=True))
 
-@dp.message(F.text == BTN_ADMIN_USTALAR)
+@dp.message(F.text == BTN_ADMIN_USTALAR, flags={"throttle": "admin"})
 async def admin_ustalar(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         return
-    rows = await list_ustalar(50)
-    if not rows:
-        await message.answer("Ustalar yo‘q.", reply_markup=admin_kb())
-        return
-    text = "📋 Admin: Ustalar (oxirgi 50)\n"
-    for r in rows:
-        active = "✅" if r["is_active"] == 1 else "⛔️"
-        text += f"{r['user_id']} | {active} {r['status']} {r['name']} | {r['job']} | {r['region']} | {r['phone']}\n"
-    await message.answer(text, reply_markup=admin_kb())
+    await send_first_page(message, "au", admin_kb())
 
-@dp.message(F.text == BTN_ADMIN_BUYURTMALAR)
+@dp.message(F.text == BTN_ADMIN_BUYURTMALAR, flags={"throttle": "admin"})
 async def admin_buyurtmalar(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         return
-    rows = await list_buyurtmalar(50)
-    if not rows:
-        await message.answer("Buyurtmalar yo‘q.", reply_markup=admin_kb())
+    await send_first_page(message, "ab", admin_kb())
+
+def _fmt_secs(secs: float) -> str:
+    minutes = int(secs // 60)
+    return f"{minutes // 60} soat {minutes % 60} daq" if minutes >= 60 else f"{minutes} daq"
+
+@dp.message(F.text == BTN_ADMIN_STATS, flags={"throttle": "admin"})
+async def admin_stats_view(message: Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
         return
-    text = "🧾 Admin: Buyurtmalar (oxirgi 50)\n"
-    for r in rows:
-        text += f"ID:{r['id']} | user:{r['user_id']} | {r['ish_turi']} | {r['region']} | {r['phone']} | {r['created_at']}\n"
+    st = await admin_stats()
+    created = sum(r["created"] for r in st["per_day"])
+    accepted = sum(r["accepted"] for r in st["per_day"])
+    secs = sum(r["secs"] for r in st["per_day"])
+    text = f"📊 Statistika (oxirgi {st['days']} kun)\n\n"
+    text += f"Buyurtmalar: {created}\nQabul qilingan: {accepted}"
+    if created:
+        text += f" ({accepted * 100 // created}%)"
+    if accepted:
+        text += f"\nO‘rtacha qabul vaqti: {_fmt_secs(secs / accepted)}"
+    text += f"\nFaol ustalar: {st['active']}\n"
+    text += "\n📅 Kunlar (buyurtma / qabul / faol ustalar):\n"
+    text += "\n".join(f"• {r['day']}: {r['created']} / {r['accepted']} / {r['active']}" for r in st["per_day"])
+    text += "\n"
+    for col, title in (("region", "📍 Hududlar"), ("job", "🛠 Kasblar"), ("active", "👷 Faol ustalar (kasb)")):
+        if st["top"][col]:
+            text += f"\n{title}:\n" + "\n".join(f"• {r['name'] or '-'}: {r['n']}" for r in st["top"][col]) + "\n"
     await message.answer(text, reply_markup=admin_kb())
 
+@dp.message(Command("rebuild_stats"), flags={"throttle": "admin"})
+async def admin_rebuild_stats(message: Message):
+    if not is_admin(message.from_user.id):
+        return
+    t0 = time.perf_counter()
+    total = await rebuild_rollups()
+    await message.answer(f"✅ Statistika qayta hisoblandi: {total} buyurtma, {time.perf_counter() - t0:.1f} s.")
+
+@dp.message(F.text == BTN_ADMIN_BROADCAST, flags={"throttle": "admin"})
+async def admin_broadcast_start(message: Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        return
+    await state.set_state(AdminFlow.broadcast_text)
+    await message.answer("📣 Faol ustalarga yuboriladigan xabar matnini yozing\n"
+                         "(nofaol va bloklangan ustalarga yuborilmaydi):", reply_markup=admin_kb())
+
+@dp.message(AdminFlow.broadcast_text, flags={"throttle": "admin"})
+async def admin_broadcast_text(message: Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        return
+    text = (message.text or "").strip()
+    if not text:
+        await message.answer("Faqat matnli xabar yuboriladi. Qayta yozing:", reply_markup=admin_kb())
+        return
+    await state.update_data(broadcast_text=text)
+    kb = InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="✅ Yuborish", callback_data="bcast_go"),
+        InlineKeyboardButton(text="❌ Bekor", callback_data="bcast_cancel"),
+    ]])
+    audience = await run_db(broadcast_audience_sync)
+    await message.answer(f"Xabar:\n\n{text}\n\n{audience} ta faol ustaga yuborilsinmi?\n"
+                         f"(nofaol va bloklangan ustalar kirmaydi)", reply_markup=kb)
+
+@dp.callback_query(F.data.in_({"bcast_go", "bcast_cancel"}), AdminFlow.broadcast_text, flags={"throttle": "admin"})
+async def admin_broadcast_confirm(cb: CallbackQuery, state: FSMContext):
+    if not is_admin(cb.from_user.id):
+        return
+    text = (await state.get_data()).get("broadcast_text")
+    await state.clear()
+    await cb.answer()
+    try:
+        await bot(cb.message.edit_reply_markup(reply_markup=None))
+    except Exception:
+        pass
+    if cb.data != "bcast_go" or not text:
+        await cb.message.answer("Bekor qilindi.", reply_markup=admin_kb())
+        return
+    progress = await cb.message.answer("📣 Tarqatma boshlanmoqda...")
+    b = await create_broadcast(cb.from_user.id, text, progress.chat.id, progress.message_id)
+    if b is None:
+        await bot.edit_message_text("⚠️ Boshqa tarqatma hali tugamagan. Keyinroq urinib ko‘ring.",
+                                    chat_id=progress.chat.id, message_id=progress.message_id)
+        return
+    progress_text, kb = broadcast_progress(b)
+    await bot.edit_message_text(progress_text, chat_id=progress.chat.id, message_id=progress.message_id,
+                                reply_markup=kb)
+    broadcaster.wake()
+
+@dp.callback_query(F.data.startswith("bcast_stop:"), flags={"throttle": "admin"})
+async def admin_broadcast_stop(cb: CallbackQuery):
+    if not is_admin(cb.from_user.id):
+        return
+    _, _, raw = (cb.data or "").partition(":")
+    if not raw.isdigit():
+        await cb.answer("Tarqatma topilmadi.")
+        return
+    b = await cancel_broadcast(int(raw))
+    await cb.answer("To‘xtatildi." if b else "Tarqatma allaqachon tugagan.")
+    if b is not None:
+        text, _ = broadcast_progress(b)
+        try:
+            await bot(cb.message.edit_text(text))
+        except Exception:
+            pass
+
 @dp.message(F.text == BTN_ADMIN_BLOCK)
 async def admin_block_start(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
@@ -701,7 +3192,7 @@ async def admin_block_start(message: Message, state: FSMContext):
     await state.set_state(AdminFlow.block_id)
     await message.answer("🚫 Bloklash uchun usta user_id yuboring:", reply_markup=admin_kb())
 
-@dp.message(AdminFlow.block_id)
+@dp.message(AdminFlow.block_id, flags={"throttle": "admin"})
 async def admin_block_do(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         return
@@ -721,7 +3212,7 @@ async def admin_unblock_start(message: Message, state: FSMContext):
     await state.set_state(AdminFlow.unblock_id)
     await message.answer("✅ Aktivlash uchun usta user_id yuboring:", reply_markup=admin_kb())
 
-@dp.message(AdminFlow.unblock_id)
+@dp.message(AdminFlow.unblock_id, flags={"throttle": "admin"})
 async def admin_unblock_do(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         return
@@ -739,11 +3230,486 @@ async def admin_unblock_do(message: Message, state: FSMContext):
 async def fallback(message: Message):
     await message.answer("Menyudan tanlang 🙂", reply_markup=main_kb(is_admin=is_admin(message.from_user.id)))
 
-async def main():
+# inline_sync_filters aiogram ichki tuzilishiga (CallableObject.callback/.awaitable,
+# params __post_init__ da hisoblanadi) tayanadi - faqat tekshirilgan versiyada
+INLINE_FILTERS_AIOGRAM = "3.4.1"
+
+def inline_sync_filters(router) -> None:
+    # aiogram sinxron filtrlarni (F.text == ..., holat filtrlari) default thread pool
+    # orqali chaqiradi: har update ~10 ta thread sakrashi. Ular arzon va sof,
+    # shuning uchun event loop ichida bajaramiz - spam pool ni to'ldira olmaydi.
+    # Barcha handlerlar ro'yxatdan o'tgandan keyin chaqiriladi; sub_router lar ham.
+    if AIOGRAM_VERSION != INLINE_FILTERS_AIOGRAM:
+        log.warning("aiogram %s (not %s): sync filters left on the thread pool", AIOGRAM_VERSION, INLINE_FILTERS_AIOGRAM)
+        return
+    for observer in router.observers.values():
+        for handler in (observer._handler, *observer.handlers):
+            for f in handler.filters or ():
+                if not f.awaitable:
+                    f.callback = _inline_filter(f.callback)
+                    f.awaitable = True
+    for sub in router.sub_routers:
+        inline_sync_filters(sub)
+
+def _inline_filter(fn):
+    async def call(*args, **kwargs):
+        return fn(*args, **kwargs)
+    return call
+
+inline_sync_filters(dp)
+
+# ----------------- UPDATE EXECUTOR -----------------
+UPDATE_WAIT = MetricHistogram("bot_update_queue_wait_seconds", "Time updates wait in the executor before a handler starts")
+UPDATES_SHED = MetricCounter("bot_updates_shed_total", "Updates dropped by the executor", ("reason",))
+
+def event_user_id(update: Update) -> int:
+    try:
+        event = update.event
+    except UpdateTypeLookupError:
+        return 0
+    user = getattr(event, "from_user", None) or getattr(event, "user", None)
+    return user.id if user is not None else 0
+
+class UpdateExecutor:
+    # Har bir foydalanuvchiga bitta vazifa: uning navbatini tartib bilan bo'shatadi
+    # (ikki marta bosish state.update_data/get_data ni poygaga solmaydi). Handlerlar
+    # soni semafor bilan cheklangan; vazifalar soni - navbati bor foydalanuvchilar soni.
+    def __init__(self, concurrency: int, backlog: int, user_backlog: int, max_age: float):
+        self.concurrency = concurrency
+        self.backlog = backlog
+        self.user_backlog = user_backlog
+        self.max_age = max_age
+        self.queued = 0  # handler ni kutayotganlar
+        self.running = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._users: Dict[int, Deque[Tuple[float, Update]]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def submit(self, update: Union[Update, dict]) -> bool:
+        # False - update tashlandi (navbat to'la)
+        if isinstance(update, dict):
+            update = Update.model_validate(update, context={"bot": bot})
+        uid = event_user_id(update)
+        pending = self._users.get(uid)
+        if self.queued >= self.backlog:
+            UPDATES_SHED.inc("backlog")
+            log.warning("executor: update %s from %s shed: backlog full (%d)", update.update_id, uid, self.queued)
+            return False
+        if pending is not None and len(pending) >= self.user_backlog:
+            UPDATES_SHED.inc("user")
+            log.warning("executor: update %s from %s shed: user backlog full (%d)", update.update_id, uid, len(pending))
+            return False
+        self.queued += 1
+        if pending is not None:
+            pending.append((time.monotonic(), update))
+            return True
+        self._users[uid] = deque([(time.monotonic(), update)])
+        task = asyncio.get_running_loop().create_task(self._run(uid))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _run(self, uid: int) -> None:
+        pending = self._users[uid]
+        try:
+            while pending:
+                async with self._semaphore:
+                    queued_at, update = pending.popleft()
+                    self.queued -= 1
+                    waited = time.monotonic() - queued_at
+                    UPDATE_WAIT.observe(waited)
+                    if self.max_age and waited > self.max_age:
+                        UPDATES_SHED.inc("stale")
+                        continue
+                    self.running += 1
+                    try:
+                        await dp.feed_update(bot, update)
+                    except Exception:
+                        log.exception("update %s failed", update.update_id)
+                    finally:
+                        self.running -= 1
+        finally:
+            self.queued -= len(pending)
+            del self._users[uid]
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        # navbatdagi hamma update lar qayta ishlanguncha kutadi; False - vaqt tugadi
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._tasks:
+            left = None if deadline is None else deadline - time.monotonic()
+            if left is not None and left <= 0:
+                return False
+            await asyncio.wait(list(self._tasks), timeout=left)
+        return True
+
+update_executor = UpdateExecutor(UPDATE_CONCURRENCY, UPDATE_BACKLOG, UPDATE_USER_BACKLOG, UPDATE_MAX_AGE)
+MetricGauge("bot_update_queue_depth", "Updates waiting in the executor", lambda: update_executor.queued)
+MetricGauge("bot_updates_running", "Updates being handled right now", lambda: update_executor.running)
+MetricGauge("bot_update_queue_users", "Users with queued or running updates", lambda: len(update_executor._users))
+
+# ----------------- WORKERS -----------------
+# Supervisor (ingress) -> worker: ("update", json_bytes), ("invalidate", user_id), ("wake",),
+# ("broadcast",), ("flush",), ("stop",). Worker -> supervisor: ("invalidate", user_id), ("wake",),
+# ("broadcast",), ("flushed",). Supervisor invalidate/wake/broadcast ni qolgan workerlarga tarqatadi.
+INGRESS_UPDATES = MetricCounter("bot_ingress_updates_total", "Updates routed to worker processes", ("worker",))
+
+def update_user_id(data: dict) -> int:
+    # xom update dagi foydalanuvchi (message.from, callback_query.from, ...)
+    for key, value in data.items():
+        if key != "update_id" and isinstance(value, dict):
+            user = value.get("from") or value.get("user")
+            if user:
+                return int(user["id"])
+    return 0
+
+class WorkerLoop:
+    # Worker ichida: supervisor xabarlarini event loop da o'qiydi (add_reader),
+    # update lar update_executor ga beriladi.
+    def __init__(self, conn):
+        self.conn = conn
+        self.stopped = asyncio.Event()
+
+    def start(self) -> None:
+        asyncio.get_running_loop().add_reader(self.conn.fileno(), self._on_readable)
+
+    def _on_readable(self) -> None:
+        try:
+            while self.conn.poll():
+                self._handle(self.conn.recv())
+        except (EOFError, OSError):
+            # supervisor o'ldi: to'xtaymiz
+            self.stopped.set()
+        if self.stopped.is_set():
+            asyncio.get_running_loop().remove_reader(self.conn.fileno())
+
+    def _handle(self, msg: tuple) -> None:
+        kind = msg[0]
+        if kind == "update":
+            update_executor.submit(json.loads(msg[1]))
+        elif kind == "invalidate":
+            usta_cache.invalidate(msg[1], publish=False)
+        elif kind == "wake":
+            delivery_dispatcher.wake(publish=False)
+        elif kind == "broadcast":
+            broadcaster.wake(publish=False)
+        elif kind == "flush":
+            asyncio.get_running_loop().create_task(self._flush())
+        elif kind == "stop":
+            self.stopped.set()
+
+    async def _flush(self) -> None:
+        await update_executor.drain()
+        cluster.publish("flushed")
+
+async def worker_main(conn) -> None:
+    await init_db()
+    metrics_runner = await start_metrics_server(METRICS_PORT + 1 + WORKER_INDEX if METRICS_PORT else 0)
+    cluster.conn = conn
+    worker = WorkerLoop(conn)
+    await dp.emit_startup(bot=bot)
+    worker.start()
+    log.info("worker %s/%s: ready", WORKER_INDEX, WORKER_COUNT)
+    try:
+        await worker.stopped.wait()
+        await update_executor.drain()
+        await dp.emit_shutdown(bot=bot)
+    finally:
+        cluster.conn = None
+        await bot.session.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        close_db()
+
+def run_worker(index: int, count: int, conn, setup: Optional[Callable[[Bot], None]] = None) -> None:
+    # spawn qilingan jarayonning kirish nuqtasi; setup - benchmark uchun (soxta sessiya)
+    global WORKER_INDEX, WORKER_COUNT
+    WORKER_INDEX, WORKER_COUNT = index, count
+    # SEND_RATE butun bot uchun: workerlar uni teng bo'lishadi (user id bo'yicha
+    # taqsimot yuklamani ham taxminan teng bo'ladi), N x SEND_RATE bo'lmasin
+    outbound.set_rate(SEND_RATE / count)
+    # Ctrl+C butun guruhga keladi: worker supervisor ning "stop" xabarini kutadi
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s w{index} %(levelname)s %(name)s: %(message)s")
+    if setup is not None:
+        setup(bot)
+    asyncio.run(worker_main(conn))
+
+class WorkerPool:
+    # N ta worker jarayoni; update lar from_user.id % N bo'yicha taqsimlanadi, shuning
+    # uchun foydalanuvchining FSM holati (xotiradagi hot qismi) doim bitta workerda.
+    # Worker o'lib qolsa qayta ishga tushiriladi.
+    def __init__(self, count: int, setup: Optional[Callable[[Bot], None]] = None):
+        self.count = count
+        self.setup = setup
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs: List[Any] = [None] * count
+        self._conns: List[Any] = [None] * count
+        self._flushed: List[Optional[asyncio.Event]] = [None] * count
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        for i in range(self.count):
+            self._spawn(i)
+
+    def _spawn(self, i: int) -> None:
+        parent, child = self._ctx.Pipe()
+        proc = self._ctx.Process(target=run_worker, args=(i, self.count, child, self.setup), name=f"worker-{i}")
+        proc.start()
+        child.close()
+        self._procs[i], self._conns[i] = proc, parent
+        # o'qish alohida threadda: supervisor loop workerga yozayotganda ham
+        # worker -> supervisor kanali bo'shatilib turadi (deadlock bo'lmaydi)
+        threading.Thread(target=self._read, args=(i, parent), name=f"worker-{i}-reader", daemon=True).start()
+
+    def _read(self, i: int, conn) -> None:
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                return
+            self._loop.call_soon_threadsafe(self._on_message, i, msg)
+
+    def _on_message(self, i: int, msg: tuple) -> None:
+        if msg[0] == "flushed":
+            if self._flushed[i] is not None:
+                self._flushed[i].set()
+            return
+        for j in range(self.count):
+            if j != i:
+                self.send(j, msg)
+
+    def send(self, i: int, msg: tuple) -> None:
+        try:
+            self._conns[i].send(msg)
+        except (BrokenPipeError, OSError):
+            log.warning("worker %s unavailable, dropped %r", i, msg[0])
+
+    def route(self, raw: bytes, user_id: int) -> None:
+        i = user_id % self.count
+        INGRESS_UPDATES.inc(i)
+        self.send(i, ("update", raw))
+
+    async def flush(self) -> None:
+        # hamma yuborilgan update lar qayta ishlanguncha kutadi
+        self._flushed = [asyncio.Event() for _ in range(self.count)]
+        for i in range(self.count):
+            self.send(i, ("flush",))
+        await asyncio.gather(*(e.wait() for e in self._flushed))
+
+    async def supervise(self) -> None:
+        while not self._stopping:
+            await asyncio.sleep(1)
+            for i, proc in enumerate(self._procs):
+                if not self._stopping and not proc.is_alive():
+                    log.error("worker %s exited with %s, restarting", i, proc.exitcode)
+                    self._conns[i].close()
+                    self._spawn(i)
+
+    async def stop(self, timeout: float = WEBHOOK_DRAIN_TIMEOUT) -> None:
+        self._stopping = True
+        for i in range(self.count):
+            self.send(i, ("stop",))
+        loop = asyncio.get_running_loop()
+        for proc in self._procs:
+            await loop.run_in_executor(None, proc.join, timeout)
+            if proc.is_alive():
+                log.warning("%s did not stop in %.0fs, terminating", proc.name, timeout)
+                proc.terminate()
+        for conn in self._conns:
+            conn.close()
+
+async def poll_updates(handle: Callable[[Update], Any], stop: asyncio.Event) -> None:
+    # bitta poller: getUpdates -> handle (update_executor yoki workerlar).
+    # Tarmoq xatolarida aiogram kabi eksponensial kutish; token yaroqsiz yoki boshqa
+    # instance ham polling qilayotgan bo'lsa davom etish ma'nosiz - xato bilan chiqadi.
+    # Qanday sabab bilan tugamasin, stop o'rnatiladi: poller siz jarayon qolmaydi.
+    allowed = dp.resolve_used_update_types()
+    backoff = Backoff(POLL_BACKOFF)
+    webhook_deleted = False
+    offset = None
+    try:
+        while not stop.is_set():
+            try:
+                if not webhook_deleted:
+                    await bot.delete_webhook()
+                    webhook_deleted = True
+                updates = await bot.get_updates(offset=offset, timeout=25, allowed_updates=allowed)
+            except (TelegramUnauthorizedError, TelegramConflictError) as e:
+                log.error("polling: fatal Bot API error, stopping: %r", e)
+                raise
+            except TelegramRetryAfter as e:
+                log.warning("polling: flood control, sleeping %ss", e.retry_after)
+                await asyncio.sleep(e.retry_after)
+                continue
+            except Exception as e:
+                log.warning("polling: request failed: %r, retry in %.1fs (tries %d)", e, backoff.next_delay, backoff.counter + 1)
+                await backoff.asleep()
+                continue
+            if backoff.counter:
+                log.info("polling: recovered after %d tries", backoff.counter)
+                backoff.reset()
+            for update in updates:
+                offset = update.update_id + 1
+                try:
+                    handle(update)
+                except Exception:
+                    log.exception("polling: update %s dropped", update.update_id)
+    finally:
+        stop.set()
+
+async def poll_ingress(pool: WorkerPool, stop: asyncio.Event) -> None:
+    def route(update: Update) -> None:
+        raw = update.model_dump_json(by_alias=True, exclude_none=True)
+        pool.route(raw.encode(), update_user_id(json.loads(raw)))
+    await poll_updates(route, stop)
+
+async def webhook_ingress(request: web.Request) -> web.Response:
+    if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+        return web.Response(status=401)
+    raw = await request.read()
+    try:
+        data = json.loads(raw)
+        uid = update_user_id(data)
+    except (ValueError, TypeError, AttributeError, KeyError) as e:
+        # buzilgan body workerga yuborilmaydi (u yerda ham Update bo'lolmaydi)
+        log.warning("supervisor: malformed webhook body rejected (%d bytes): %r", len(raw), e)
+        return web.Response(status=400)
+    request.app["pool"].route(raw, uid)
+    return web.Response()
+
+async def run_supervisor(mode: str) -> None:
+    if mode == "webhook" and WEBHOOK_URL and not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET environment variable not set")
+    pool = WorkerPool(WORKERS)
+    pool.start()
+    supervise = asyncio.create_task(pool.supervise())
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    runner = None
+    try:
+        if mode == "webhook":
+            app = web.Application()
+            app["pool"] = pool
+            app.router.add_post(WEBHOOK_PATH, webhook_ingress)
+            if WEBHOOK_URL:
+                app.on_startup.append(on_webhook_startup)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+            log.info("supervisor: webhook on %s:%s%s -> %d workers", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WORKERS)
+            await stop.wait()
+        elif mode == "polling":
+            log.info("supervisor: polling -> %d workers", WORKERS)
+            ingress = asyncio.create_task(poll_ingress(pool, stop))
+            ingress.add_done_callback(lambda _: stop.set())
+            await stop.wait()
+            if ingress.done():
+                ingress.result()  # ingress o'zi tugagan (xato) - workerlar to'xtatiladi, xato chiqadi
+            ingress.cancel()
+        else:
+            raise RuntimeError(f"Unknown BOT_MODE: {mode}")
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+        supervise.cancel()
+        await pool.stop()
+        await bot.session.close()
+
+# ----------------- RUN -----------------
+class DrainingRequestHandler(SimpleRequestHandler):
+    # update lar update_executor ga beriladi (Telegramga darhol 200); to'xtashda
+    # navbatdagi va ishlayotgan handlerlarni kutib, keyin sessiyani yopadi.
+    # Buzilgan body - 400 va log; tashlangan update submit ichida log qilinadi.
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        try:
+            update = Update.model_validate(await request.json(loads=bot.session.json_loads), context={"bot": bot})
+        except ValueError as e:
+            log.warning("webhook: malformed update rejected: %r", e)
+            return web.Response(status=400)
+        update_executor.submit(update)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def close(self) -> None:
+        if update_executor._tasks:
+            log.info("webhook: draining %d queued, %d in-flight updates", update_executor.queued, update_executor.running)
+            await update_executor.drain(WEBHOOK_DRAIN_TIMEOUT)
+        await super().close()
+
+async def on_webhook_startup(app: web.Application) -> None:
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET or None,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+
+async def run_webhook() -> None:
+    if WEBHOOK_URL and not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET environment variable not set")
+    app = web.Application()
+    # handler birinchi ro'yxatdan o'tadi: shutdown da avval drain, keyin dp shutdown
+    DrainingRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET or None).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    if WEBHOOK_URL:
+        app.on_startup.append(on_webhook_startup)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    log.info("webhook: listening on %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+async def run_polling() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await dp.emit_startup(bot=bot)
+    log.info("polling: started")
+    poller = asyncio.create_task(poll_updates(update_executor.submit, stop))
+    poller.add_done_callback(lambda _: stop.set())
+    try:
+        await stop.wait()
+        if poller.done():
+            poller.result()  # poller o'zi tugagan (xato) - jarayon xato bilan tugaydi
+    finally:
+        poller.cancel()
+        await update_executor.drain(WEBHOOK_DRAIN_TIMEOUT)
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+
+async def main(mode: str = BOT_MODE):
+    # migratsiyalar bir marta shu yerda (worker rejimida workerlardan oldin)
     await init_db()
-    await dp.start_polling(bot)
+    metrics_runner = await start_metrics_server()
+    try:
+        if WORKERS > 1:
+            await run_supervisor(mode)
+        elif mode == "webhook":
+            await run_webhook()
+        elif mode == "polling":
+            await run_polling()
+        else:
+            raise RuntimeError(f"Unknown BOT_MODE: {mode}")
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        close_db()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else BOT_MODE))
 
 